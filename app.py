@@ -1,11 +1,10 @@
 import streamlit as st
-import tempfile
 import os
-import shutil
-import zipfile
-from moviepy.editor import VideoFileClip, ImageClip, concatenate_videoclips
-from PIL import Image, ImageFont, ImageDraw, ImageColor
-import numpy as np
+from PIL import Image
+from vconvert import store_upload, store_font, probe_info, INTERPOLATIONS, default_workers
+from vconvert import DITHER_MODES, STATS_MODES, GIF_ENCODERS, WEBP_PRESETS, convert_animation, extract_images, extraction_times
+from vconvert import get_job_manager, QueueFullError, get_result_cache, enable_json_log, start_metrics_server
+from vconvert import get_proxy_store, preview_frame, preview_strip
 
 # --- 言語設定辞書 (大幅追加) ---
 LANGUAGES = {
@@ -60,6 +59,18 @@ LANGUAGES = {
         "output_format": "出力形式",
         "resize_width": "横幅リサイズ (px)",
         "fps": "FPS (滑らかさ)",
+        "workers": "並列処理数 (1で無効)",
+        "gif_encoder": "GIFエンコーダ",
+        "gif_dither": "ディザリング",
+        "gif_colors": "最大色数",
+        "gif_stats": "パレット作成方法",
+        "dedup": "重複フレームを除去 (可変フレーム長)",
+        "dedup_tol": "重複とみなす差 (0で完全一致のみ)",
+        "webp_preset": "WebPプリセット",
+        "webp_quality": "WebP品質 (低← →高)",
+        "target_size": "目標ファイルサイズに収める",
+        "target_mb": "目標サイズ (MB)",
+        "target_hint": "横幅・FPS・色数/品質は上限として扱い、収まるように自動で下げます。",
         "thumb_section": "🖼 サムネイル(先頭フレーム)の設定",
         "thumb_enable": "先頭に静止画を結合",
         "thumb_mode": "選択モード",
@@ -67,6 +78,10 @@ LANGUAGES = {
         "mode_upload": "画像をアップロード",
         "btn_extract_thumb": "📸 この瞬間をサムネイルにする",
         "thumb_done": "✅ サムネイル確定済み",
+        "preview_section": "👀 プレビュー",
+        "preview_frame": "開始位置のフレーム (出力サイズ・透かし入り)",
+        "preview_strip": "ループプレビュー (低fps)",
+        "preview_preparing": "プレビュー用の縮小動画を作成中...",
         "btn_convert_anim": "🚀 アニメーション変換を開始",
         # 静止画抽出用
         "image_title": "📷 静止画抽出設定",
@@ -74,10 +89,16 @@ LANGUAGES = {
         "extract_mode": "抽出方法",
         "mode_count": "指定枚数で均等抽出",
         "mode_interval": "一定間隔(秒)で抽出",
+        "mode_keyframes": "キーフレームのみ (高速)",
+        "mode_scene": "シーンの切り替わりで抽出",
         "extract_count": "抽出枚数",
         "extract_interval": "間隔(秒)",
+        "min_interval": "最小間隔(秒)",
+        "max_frames": "最大枚数",
+        "scene_threshold": "切り替わりの感度 (低← →高)",
         "image_format": "画像形式",
         "jpeg_quality": "JPEG品質 (低← →高)",
+        "interpolation": "リサイズ方式",
         "btn_extract_image": "🚀 静止画抽出を開始 (ZIP作成)",
         # ステータスメッセージ
         "status_cut": "動画をカット中...",
@@ -85,9 +106,17 @@ LANGUAGES = {
         "status_wm": "透かしを合成中...",
         "status_thumb": "サムネイルを結合中...",
         "status_export_anim": "アニメーション変換中...（時間がかかります）",
+        "status_analyzing": "シーンの切り替わりを解析中...",
         "status_extracting": "画像を抽出・加工中...",
         "status_zipping": "ZIPファイルを作成中...",
         "finish": "✨ 完了しました！",
+        "status_queued": "順番待ち中...",
+        "progress_eta": "({done}/{total} フレーム・残り約 {eta} 秒)",
+        "err_queue_full": "混み合っています。しばらくしてからもう一度お試しください。",
+        "status_sampling": "出力サイズを見積もり中...",
+        "status_retry_size": "目標サイズを超えたため、設定を下げて再変換中...",
+        "output_size": "出力サイズ: {mb:.2f} MB",
+        "warn_target_over": "最小の設定でも目標サイズに収まりませんでした。切り出す範囲を短くしてください。",
         "download_anim": "📥 アニメーションを保存",
         "download_zip": "📥 画像ZIPを保存",
         "info_upload": "まずは動画ファイルをアップロードしてください。",
@@ -145,6 +174,18 @@ LANGUAGES = {
         "output_format": "Output Format",
         "resize_width": "Resize Width (px)",
         "fps": "FPS",
+        "workers": "Parallel workers (1 = off)",
+        "gif_encoder": "GIF Encoder",
+        "gif_dither": "Dithering",
+        "gif_colors": "Max Colors",
+        "gif_stats": "Palette Mode",
+        "dedup": "Drop duplicate frames (variable delays)",
+        "dedup_tol": "Duplicate tolerance (0 = exact only)",
+        "webp_preset": "WebP Preset",
+        "webp_quality": "WebP Quality (Low← →High)",
+        "target_size": "Fit a target file size",
+        "target_mb": "Target size (MB)",
+        "target_hint": "Width, FPS and colors/quality are treated as upper limits and lowered automatically to fit.",
         "thumb_section": "🖼 Thumbnail Settings",
         "thumb_enable": "Add static frame at start",
         "thumb_mode": "Mode",
@@ -152,6 +193,10 @@ LANGUAGES = {
         "mode_upload": "Upload image",
         "btn_extract_thumb": "📸 Set as thumbnail",
         "thumb_done": "✅ Thumbnail confirmed",
+        "preview_section": "👀 Preview",
+        "preview_frame": "Frame at start (output size, with watermarks)",
+        "preview_strip": "Looping preview (low fps)",
+        "preview_preparing": "Preparing a low-resolution copy for previews...",
         "btn_convert_anim": "🚀 Start Animation Conversion",
         # Image Extraction
         "image_title": "📷 Frame Extraction Settings",
@@ -159,10 +204,16 @@ LANGUAGES = {
         "extract_mode": "Extraction Method",
         "mode_count": "Total Count (Evenly spaced)",
         "mode_interval": "Time Interval (sec)",
+        "mode_keyframes": "Keyframes only (fast)",
+        "mode_scene": "Scene changes",
         "extract_count": "Total Images",
         "extract_interval": "Interval (sec)",
+        "min_interval": "Min Interval (sec)",
+        "max_frames": "Max Images",
+        "scene_threshold": "Scene Sensitivity (Low← →High)",
         "image_format": "Image Format",
         "jpeg_quality": "JPEG Quality (Low← →High)",
+        "interpolation": "Resize Method",
         "btn_extract_image": "🚀 Start Extraction (Create ZIP)",
         # Status
         "status_cut": "Trimming video...",
@@ -170,9 +221,17 @@ LANGUAGES = {
         "status_wm": "Applying watermarks...",
         "status_thumb": "Merging thumbnail...",
         "status_export_anim": "Converting animation... (Takes time)",
+        "status_analyzing": "Detecting scene changes...",
         "status_extracting": "Extracting and processing frames...",
         "status_zipping": "Creating ZIP file...",
         "finish": "✨ Completed!",
+        "status_queued": "Waiting in queue...",
+        "progress_eta": "({done}/{total} frames, about {eta} s left)",
+        "err_queue_full": "The server is busy. Please try again later.",
+        "status_sampling": "Estimating output size...",
+        "status_retry_size": "Over the target size, re-encoding with lower settings...",
+        "output_size": "Output size: {mb:.2f} MB",
+        "warn_target_over": "Could not fit the target size even with the lowest settings. Try a shorter range.",
         "download_anim": "📥 Download Animation",
         "download_zip": "📥 Download ZIP",
         "info_upload": "Please upload a video file first.",
@@ -204,34 +263,15 @@ else:
 FONTS_DIR = "fonts"
 available_fonts = sorted([f for f in os.listdir(FONTS_DIR) if f.lower().endswith(('.ttf', '.otf'))]) if os.path.exists(FONTS_DIR) else []
 
-# --- 透かし描画関数 (共通) ---
-def draw_watermarks(pil_img, wm_configs):
-    img = pil_img.convert("RGBA")
-    W, H = img.size
-    for wm in wm_configs:
-        txt_layer = Image.new("RGBA", img.size, (255,255,255,0))
-        d = ImageDraw.Draw(txt_layer)
-        try: fnt = ImageFont.truetype(wm["font"], wm["size"]) if wm["font"] else ImageFont.load_default()
-        except: fnt = ImageFont.load_default()
-        
-        b = d.textbbox((0,0), wm["text"], font=fnt)
-        tw, th, m = b[2]-b[0], b[3]-b[1], 20
-        
-        pos_idx = L["pos_opts"].index(wm["pos"])
-        if pos_idx == 0: x, y = W-tw-m, H-th-m # 右下
-        elif pos_idx == 1: x, y = m, H-th-m # 左下
-        elif pos_idx == 2: x, y = m, m # 左上
-        elif pos_idx == 3: x, y = W-tw-m, m # 右上
-        else: x, y = (W-tw)/2, (H-th)/2 # 中央
-        
-        rgb, fill = ImageColor.getrgb(wm["color"]), (0,0,0,int(255*wm["opacity"]/100))
-        if wm["shadow"]:
-            for ax in range(-2,3):
-                for ay in range(-2,3): d.text((x+ax, y+ay), wm["text"], font=fnt, fill=fill)
-        d.text((x,y), wm["text"], font=fnt, fill=(rgb[0],rgb[1],rgb[2],int(255*wm["opacity"]/100)))
-        img = Image.alpha_composite(img, txt_layer)
-    return img.convert("RGB")
-
+# 変換はバックグラウンドのジョブで行う (ジョブごとに専用の作業ディレクトリ)
+job_manager = get_job_manager()
+# 同じ動画・同じ設定の変換結果は保存済みのものを返す
+result_cache = get_result_cache()
+# プレビュー用の縮小動画 (アップロードごとに1回だけバックグラウンドで作る)
+proxy_store = get_proxy_store()
+# 計測: ジョブごとの JSON ログを標準エラーへ出す。環境変数 VCONVERT_METRICS_PORT があれば /metrics を公開する
+enable_json_log()
+if os.environ.get("VCONVERT_METRICS_PORT"): start_metrics_server(os.environ["VCONVERT_METRICS_PORT"])
 
 # --- メイン画面 ---
 st.title(L["title"])
@@ -239,19 +279,23 @@ st.title(L["title"])
 uploaded_file = st.file_uploader(L["upload_label"], type=['mp4', 'mov', 'avi'])
 
 if uploaded_file is not None:
-    # 動画の一時保存
-    tfile = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
-    tfile.write(uploaded_file.read())
-    video_path = tfile.name
+    # 動画の保存 (同じ内容なら再実行時もコピーせず再利用)
+    video_path = store_upload(uploaded_file, st.session_state)
     
     if 'last_video_name' not in st.session_state or st.session_state.last_video_name != uploaded_file.name:
         st.session_state.last_video_name = uploaded_file.name
         st.session_state.selected_thumb_img = None
     
     try:
-        clip = VideoFileClip(video_path)
+        # 画面ではメタデータだけを使う (読み込みプロセスは開かない。プローブ結果はファイルごとにキャッシュ)
+        clip = probe_info(video_path)
+        # 保存領域のファイル名が内容のハッシュなので、そのままプロキシのキーにする (できるまでは None)
+        proxy_key = os.path.splitext(os.path.basename(video_path))[0]
+        proxy_path = proxy_store.request(video_path, clip.size, key=proxy_key)
+        # 作成に失敗した場合は元の動画でプレビューする (遅くなるだけ)
+        preview_src = proxy_path or (video_path if proxy_key in proxy_store.failed else None)
         col_pre1, col_pre2 = st.columns([2, 1])
-        with col_pre1: st.video(video_path)
+        with col_pre1: st.video(proxy_path or video_path)
         with col_pre2:
             st.subheader(L["video_info"])
             st.metric(L["duration"], f"{clip.duration:.1f} s")
@@ -276,6 +320,28 @@ if uploaded_file is not None:
             out_fmt = c1.selectbox(L["output_format"], ["GIF", "WebP"])
             resize_width = c2.number_input(L["resize_width"], 100, 2000, 300)
             fps = c3.slider(L["fps"], 1, 60, 10)
+            max_workers = os.cpu_count() or 1
+            workers = st.slider(L["workers"], 1, max_workers, default_workers()) if max_workers > 1 else 1
+            if out_fmt == "GIF":
+                c_g1, c_g2, c_g3, c_g4 = st.columns(4)
+                gif_encoder = c_g1.selectbox(L["gif_encoder"], GIF_ENCODERS)
+                gif_dither = c_g2.selectbox(L["gif_dither"], DITHER_MODES)
+                gif_colors = c_g3.number_input(L["gif_colors"], 4, 256, 256)
+                gif_stats = c_g4.selectbox(L["gif_stats"], STATS_MODES)
+            else:
+                c_w1, c_w2 = st.columns(2)
+                webp_preset = c_w1.selectbox(L["webp_preset"], list(WEBP_PRESETS))
+                # 可逆のプリセットでは品質はエンコードの手間になるので、非可逆のときだけ選べるようにする (初期値はプリセットの値)
+                preset_opts = WEBP_PRESETS[webp_preset]
+                webp_quality = None if preset_opts["lossless"] else c_w2.slider(L["webp_quality"], 10, 100, preset_opts["quality"], key=f"webp_q_{webp_preset}")
+            c_d1, c_d2 = st.columns(2)
+            dedup = c_d1.checkbox(L["dedup"])
+            dedup_tol = c_d2.slider(L["dedup_tol"], 0, 20, 2) if dedup else 0
+            # 目標サイズ: 短い区間で試してから設定を選ぶので、本番の変換は1回 (超えた場合のみもう1回)
+            c_t1, c_t2 = st.columns(2)
+            use_target = c_t1.checkbox(L["target_size"])
+            target_mb = c_t2.number_input(L["target_mb"], 0.1, 500.0, 5.0, 0.1) if use_target else None
+            if use_target: st.caption(L["target_hint"])
 
         with st.expander(L["wm_section"]):
             wm_configs = []
@@ -300,10 +366,17 @@ if uploaded_file is not None:
                             if available_fonts: f_path = os.path.join(FONTS_DIR, st.selectbox(f"{L['font_src']} select", available_fonts, key=f"a_fsel_{i}"))
                         else:
                             f_file = st.file_uploader("Font file", type=["ttf", "otf"], key=f"a_fup_{i}")
-                            if f_file:
-                                f_path = f"temp_a_f_{i}.ttf"
-                                with open(f_path, "wb") as f: f.write(f_file.read())
-                        wm_configs.append({"text": txt, "pos": pos, "color": color, "size": size, "opacity": opacity, "shadow": shadow, "font": f_path})
+                            if f_file: f_path = store_font(f_file)
+                        wm_configs.append({"text": txt, "pos": L["pos_opts"].index(pos), "color": color, "size": size, "opacity": opacity, "shadow": shadow, "font": f_path})
+
+        # 設定を変えるたびに、開始位置のフレームと短いループをプロキシから作り直す (透かしの変更だけならデコードしない)
+        with st.expander(L["preview_section"], expanded=True):
+            if preview_src is None: st.caption(L["preview_preparing"])
+            else:
+                t_prev = min(start_t, max(0.0, clip.duration - 1.0 / clip.fps))
+                c_pv1, c_pv2 = st.columns(2)
+                c_pv1.image(preview_frame(preview_src, t_prev, clip.size, clip.fps, resize_width, wm_configs), caption=L["preview_frame"])
+                c_pv2.image(preview_strip(preview_src, t_prev, max(end_t, t_prev), clip.size, clip.fps, resize_width, wm_configs), caption=L["preview_strip"])
 
         with st.expander(L["thumb_section"]):
             enable_thumb = st.checkbox(L["thumb_enable"])
@@ -313,7 +386,7 @@ if uploaded_file is not None:
                 if t_mode == L["mode_extract"]:
                     t_time = st.slider("sec", 0.0, max(0.0, clip.duration-0.1), 0.0, 0.1)
                     if st.button(L["btn_extract_thumb"]):
-                        st.session_state.selected_thumb_img = Image.fromarray(clip.get_frame(t_time))
+                        st.session_state.selected_thumb_img = Image.fromarray(preview_frame(video_path, t_time, clip.size, clip.fps, clip.w, []))
                         st.rerun()
                     if st.session_state.selected_thumb_img:
                         st.image(st.session_state.selected_thumb_img, width=200)
@@ -325,28 +398,37 @@ if uploaded_file is not None:
 
         st.markdown("---")
         if st.button(L["btn_convert_anim"], type="primary"):
-            prog = st.progress(0); status = st.empty()
+            settings = {"start": start_t, "end": end_t, "format": out_fmt, "width": resize_width, "fps": fps, "workers": workers,
+                        "dedup": dedup, "dedup_tol": dedup_tol, "wm_configs": wm_configs,
+                        "target_bytes": int(target_mb * 1024 ** 2) if use_target else None,
+                        "thumb": thumb_img_final.convert("RGB") if enable_thumb and thumb_img_final else None}
+            if out_fmt == "GIF": settings.update(gif_encoder=gif_encoder, gif_dither=gif_dither, gif_colors=gif_colors, gif_stats=gif_stats)
+            else: settings.update(webp_preset=webp_preset, webp_quality=webp_quality)
+            out_name = f"result.{out_fmt.lower()}"
             try:
-                status.text(L["status_cut"]); processed = clip.subclip(start_t, end_t); prog.progress(10)
-                status.text(L["status_resize"]); processed = processed.resize(width=resize_width); prog.progress(30)
-                if wm_configs:
-                    status.text(L["status_wm"])
-                    processed = processed.fl_image(lambda frame: np.array(draw_watermarks(Image.fromarray(frame), wm_configs)))
-                prog.progress(50)
-                if enable_thumb and thumb_img_final:
-                    status.text(L["status_thumb"]); t_img = thumb_img_final.convert("RGB")
-                    th_h = int(resize_width * (t_img.height / t_img.width)); t_img = t_img.resize((resize_width, th_h), Image.Resampling.LANCZOS)
-                    t_clip = ImageClip(np.array(t_img)).set_duration(0.1).set_fps(fps)
-                    processed = concatenate_videoclips([t_clip, processed], method="compose")
-                prog.progress(70)
-                status.text(L["status_export_anim"]); out_name = f"output.{out_fmt.lower()}"
-                if out_fmt == "WebP": processed.write_videofile(out_name, fps=fps, codec='libwebp', ffmpeg_params=["-preset", "default", "-loop", "0", "-qscale", "80", "-method", "0"])
-                else: processed.write_gif(out_name, fps=fps)
-                prog.progress(100); status.success(L["finish"])
-                with open(out_name, "rb") as f: st.download_button(L["download_anim"], f, file_name=f"result.{out_fmt.lower()}")
-                st.image(out_name)
-            except Exception as e: st.error(f"Error: {e}")
-            finally: clip.close(); (processed.close() if 'processed' in locals() else None)
+                job = job_manager.submit("anim", lambda job: convert_animation(video_path, job.path(out_name), settings, job.update, cache=result_cache, metrics=job.metrics))
+                st.session_state.anim_job_id = job.id
+                st.session_state.anim_target_bytes = settings["target_bytes"]
+            except QueueFullError: st.error(L["err_queue_full"])
+
+        # ジョブの状態表示 (終わるまで最長1秒ごとに再実行して進捗を更新。終わればすぐ再実行)
+        job = job_manager.get(st.session_state.get("anim_job_id"))
+        if job is not None:
+            prog = st.progress(job.progress); status = st.empty()
+            if job.status == "failed": st.error(f"Error: {job.error}")
+            elif job.status == "done":
+                status.success(L["finish"])
+                with open(job.result, "rb") as f: st.download_button(L["download_anim"], f, file_name=os.path.basename(job.result))
+                out_bytes = os.path.getsize(job.result)
+                st.caption(L["output_size"].format(mb=out_bytes / 1024 ** 2))
+                target_bytes = st.session_state.get("anim_target_bytes")
+                if target_bytes and out_bytes > target_bytes: st.warning(L["warn_target_over"])
+                st.image(job.result)
+            else:
+                msg = L[job.message] if job.message else L["status_queued"]
+                if job.eta() is not None: msg += " " + L["progress_eta"].format(done=job.metrics.done, total=job.metrics.total, eta=int(job.eta()) + 1)
+                status.text(msg)
+                job.wait(1); st.rerun()
 
     # ==========================================
     # モードB: 静止画抽出 (PNG/JPG) - 新機能
@@ -357,17 +439,24 @@ if uploaded_file is not None:
         with st.expander(L["extract_settings"], expanded=True):
             c_ex1, c_ex2 = st.columns(2)
             with c_ex1:
-                extract_method = st.radio(L["extract_mode"], [L["mode_count"], L["mode_interval"]])
+                extract_method = st.radio(L["extract_mode"], [L["mode_count"], L["mode_interval"], L["mode_keyframes"], L["mode_scene"]])
             with c_ex2:
                 if extract_method == L["mode_count"]:
                     extract_count = st.number_input(L["extract_count"], min_value=2, value=10, step=1)
-                else:
+                elif extract_method == L["mode_interval"]:
                     extract_interval = st.number_input(L["extract_interval"], min_value=0.1, value=1.0, step=0.1)
+                else:
+                    # キーフレーム / シーン: 近すぎるフレームを除き、枚数の上限を決める
+                    min_interval = st.number_input(L["min_interval"], min_value=0.0, value=0.5, step=0.1)
+                    max_frames = st.number_input(L["max_frames"], min_value=1, max_value=1000, value=100, step=1)
+                    # 感度を上げるほど小さな変化でも切り替わりとみなす (閾値 = 平均差分 0.02-0.30)
+                    if extract_method == L["mode_scene"]: scene_sensitivity = st.slider(L["scene_threshold"], 1, 100, 78)
             
-            c_set1, c_set2, c_set3 = st.columns(3)
+            c_set1, c_set2, c_set3, c_set4 = st.columns(4)
             resize_width_img = c_set1.number_input(L["resize_width"], 100, 4000, 1920)
             img_format = c_set2.selectbox(L["image_format"], ["JPEG", "PNG"])
             jpeg_quality = c_set3.slider(L["jpeg_quality"], 10, 100, 85) if img_format == "JPEG" else 100
+            interp_img = c_set4.selectbox(L["interpolation"], list(INTERPOLATIONS))
 
         # 透かし設定 (アニメーション用とコードは同じだがキーを変えて独立させる)
         with st.expander(L["wm_section"]):
@@ -393,10 +482,12 @@ if uploaded_file is not None:
                             if available_fonts: f_path = os.path.join(FONTS_DIR, st.selectbox(f"{L['font_src']} select", available_fonts, key=f"i_fsel_{i}"))
                         else:
                             f_file = st.file_uploader("Font file", type=["ttf", "otf"], key=f"i_fup_{i}")
-                            if f_file:
-                                f_path = f"temp_i_f_{i}.ttf"
-                                with open(f_path, "wb") as f: f.write(f_file.read())
-                        wm_configs_img.append({"text": txt, "pos": pos, "color": color, "size": size, "opacity": opacity, "shadow": shadow, "font": f_path})
+                            if f_file: f_path = store_font(f_file)
+                        wm_configs_img.append({"text": txt, "pos": L["pos_opts"].index(pos), "color": color, "size": size, "opacity": opacity, "shadow": shadow, "font": f_path})
+
+        with st.expander(L["preview_section"], expanded=True):
+            if preview_src is None: st.caption(L["preview_preparing"])
+            else: st.image(preview_frame(preview_src, 0.0, clip.size, clip.fps, resize_width_img, wm_configs_img), caption=L["preview_frame"])
 
         st.markdown("---")
         if st.button(L["btn_extract_image"], type="primary"):
@@ -404,69 +495,36 @@ if uploaded_file is not None:
             if extract_method == L["mode_count"] and extract_count < 2: st.error(L["err_count"]); st.stop()
             if extract_method == L["mode_interval"] and extract_interval <= 0: st.error(L["err_interval"]); st.stop()
 
-            prog = st.progress(0); status = st.empty()
-            status.text(L["status_extracting"])
-            
+            if extract_method == L["mode_count"]: settings = {"mode": "count", "count": extract_count}
+            elif extract_method == L["mode_interval"]: settings = {"mode": "interval", "interval": extract_interval}
+            elif extract_method == L["mode_keyframes"]: settings = {"mode": "keyframes", "min_interval": min_interval, "max_frames": max_frames}
+            else: settings = {"mode": "scene", "min_interval": min_interval, "max_frames": max_frames,
+                              "scene_threshold": round(0.30 - (scene_sensitivity - 1) * 0.28 / 99, 4)}
+            if settings["mode"] in ("count", "interval") and len(extraction_times(clip.duration, **settings)) == 0: st.error("抽出対象のフレームがありません。"); st.stop()
+            settings.update(width=resize_width_img, format=img_format, quality=jpeg_quality, interpolation=interp_img, wm_configs=wm_configs_img)
             try:
-                # 抽出する時間のリストを作成
-                if extract_method == L["mode_count"]:
-                    times = np.linspace(0, clip.duration - 0.1, extract_count)
-                else:
-                    times = np.arange(0, clip.duration - 0.1, extract_interval)
-                
-                total_frames = len(times)
-                if total_frames == 0: st.error("抽出対象のフレームがありません。"); st.stop()
-
-                # 一時ディレクトリ作成
-                tmp_dir = tempfile.mkdtemp()
-                zip_path = os.path.join(tempfile.gettempdir(), "images.zip")
-
-                # ループ処理
-                for i, t in enumerate(times):
-                    # フレーム取得 -> PIL変換
-                    frame = clip.get_frame(t)
-                    img = Image.fromarray(frame)
-                    
-                    # リサイズ
-                    aspect = img.height / img.width
-                    target_h = int(resize_width_img * aspect)
-                    img = img.resize((resize_width_img, target_h), Image.Resampling.LANCZOS)
-                    
-                    # 透かし合成
-                    if wm_configs_img:
-                        img = draw_watermarks(img, wm_configs_img)
-                    
-                    # 保存
-                    ext = "jpg" if img_format == "JPEG" else "png"
-                    save_path = os.path.join(tmp_dir, f"image_{i+1:03d}.{ext}")
-                    if img_format == "JPEG":
-                        img.convert("RGB").save(save_path, quality=jpeg_quality)
-                    else:
-                        img.save(save_path)
-                    
-                    prog.progress(int((i + 1) / total_frames * 80)) # 80%まで進める
+                job = job_manager.submit("image", lambda job: extract_images(video_path, job.path("extracted_images.zip"), settings, job.update, cache=result_cache, metrics=job.metrics))
+                st.session_state.img_job_id = job.id
+            except QueueFullError: st.error(L["err_queue_full"])
 
-                # ZIP作成
-                status.text(L["status_zipping"])
-                with zipfile.ZipFile(zip_path, 'w') as zipf:
-                    for root, dirs, files in os.walk(tmp_dir):
-                        for file in files:
-                            zipf.write(os.path.join(root, file), file)
-                
-                prog.progress(100)
+        # ジョブの状態表示 (終わるまで最長1秒ごとに再実行して進捗を更新。終わればすぐ再実行)
+        job = job_manager.get(st.session_state.get("img_job_id"))
+        if job is not None:
+            prog = st.progress(job.progress); status = st.empty()
+            if job.status == "failed": st.error(f"Error: {job.error}")
+            elif job.status == "done":
                 status.success(L["finish"])
-                
-                # ダウンロードボタン
-                with open(zip_path, "rb") as f:
-                    st.download_button(L["download_zip"], f, file_name="extracted_images.zip", mime="application/zip")
+                # ダウンロードボタン (ZIP はジョブの作業ディレクトリにある)
+                with open(job.result, "rb") as f: st.download_button(L["download_zip"], f, file_name="extracted_images.zip", mime="application/zip")
+            else:
+                msg = L[job.message] if job.message else L["status_queued"]
+                if job.eta() is not None: msg += " " + L["progress_eta"].format(done=job.metrics.done, total=job.metrics.total, eta=int(job.eta()) + 1)
+                status.text(msg)
+                job.wait(1); st.rerun()
 
-            except Exception as e:
-                st.error(f"Error: {e}")
-            finally:
-                clip.close()
-                # お掃除
-                if 'tmp_dir' in locals() and os.path.exists(tmp_dir): shutil.rmtree(tmp_dir)
-                if 'zip_path' in locals() and os.path.exists(zip_path): os.remove(zip_path)
+    # プロキシの作成中は、できあがったらすぐプレビューを出せるよう最長1秒ごとに再実行する
+    if preview_src is None:
+        proxy_store.wait(proxy_key, 1); st.rerun()
 
 else:
     st.info(L["info_upload"])
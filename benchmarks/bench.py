@@ -0,0 +1,210 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# --- ベンチマーク ---
+# ffmpeg のテストソースで合成した動画を使い、透かし・静止画抽出・GIF/WebP 書き出しの速度を測る。
+# ネットワークも GPU も不要。結果 (フレーム/秒、経過時間、最大メモリ、出力サイズ) を JSON に書き出し、
+# 保存済みのベースラインと比べて閾値を超えて悪化した項目があれば終了コード 1 を返す。
+#   python benchmarks/bench.py                      # 計測して benchmarks/results.json に書き出す
+#   python benchmarks/bench.py --save-baseline      # 計測結果をベースラインとして保存する
+#   python benchmarks/bench.py --quick --max-slowdown 0.2
+# 各ケースは別プロセスで実行する (最大メモリをケースごとに測るため)。
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(HERE, "results.json")
+CLIP_DIR = os.path.join(HERE, ".clips")
+
+# (名前, 幅, 高さ, 秒数, fps)
+CLIPS = [("360p_10s", 640, 360, 10, 30), ("720p_10s", 1280, 720, 10, 30), ("1080p_20s", 1920, 1080, 20, 30)]
+QUICK_CLIPS = ["360p_10s", "720p_10s"]
+WM_POSITIONS = [0, 2, 4]
+
+
+def make_clip(name, w, h, seconds, fps):
+    # 毎回同じ内容になるよう、テストソースとエンコード設定を固定する
+    from vconvert.ffmpeg import ffmpeg_exe
+    os.makedirs(CLIP_DIR, exist_ok=True)
+    path = os.path.join(CLIP_DIR, f"{name}.mp4")
+    if os.path.exists(path): return path
+    cmd = [ffmpeg_exe(), "-v", "error", "-f", "lavfi", "-i", f"testsrc2=size={w}x{h}:rate={fps}:duration={seconds}",
+           "-c:v", "libx264", "-preset", "veryfast", "-g", str(fps * 2), "-pix_fmt", "yuv420p", "-threads", "1", "-y", path + ".part.mp4"]
+    subprocess.run(cmd, check=True)
+    os.replace(path + ".part.mp4", path)
+    return path
+
+
+def _wm_configs(n, shadow):
+    return [{"text": f"Bench {i+1}", "pos": WM_POSITIONS[i], "color": "#FFFFFF", "size": 40, "opacity": 80, "shadow": shadow, "font": None}
+            for i in range(n)]
+
+
+# --- 各ケース (ワーカープロセスで実行。(フレーム数, 出力バイト数) を返す) ---
+
+def case_watermark(clip, n_wm, shadow, frames=200, api="numpy"):
+    import numpy as np
+    from PIL import Image
+    from vconvert import apply_watermarks, draw_watermarks
+    from vconvert.extract import probe_size
+    w, h = probe_size(clip)
+    frame = (np.arange(w * h * 3, dtype=np.uint32) % 251).astype(np.uint8).reshape(h, w, 3)
+    cfgs = _wm_configs(n_wm, shadow)
+    if api == "pil":
+        img = Image.fromarray(frame)
+        for _ in range(frames): draw_watermarks(img, cfgs)
+    else:
+        for _ in range(frames): apply_watermarks(frame, cfgs)
+    return frames, 0
+
+
+def case_extract(clip, out, mode, value=None, width=1280):
+    from vconvert import extract_images
+    settings = {"mode": mode, "width": width, "format": "JPEG", "quality": 85}
+    if mode in ("count", "interval"): settings[mode] = value
+    extract_images(clip, out, settings)
+    import zipfile
+    with zipfile.ZipFile(out) as z: n = len(z.namelist())
+    return n, os.path.getsize(out)
+
+
+def case_export(clip, out, fmt, width=480, fps=10, n_wm=1):
+    from vconvert import convert_animation
+    settings = {"format": fmt, "width": width, "fps": fps, "wm_configs": _wm_configs(n_wm, True)}
+    convert_animation(clip, out, settings)
+    from PIL import Image
+    with Image.open(out) as im: n = getattr(im, "n_frames", 1)
+    return n, os.path.getsize(out)
+
+
+CASES = {"watermark": case_watermark, "extract": case_extract, "export": case_export}
+
+
+def _run_case(kind, kwargs, repeat):
+    # 最速の回の時間を採用する。最大メモリは子プロセス (ffmpeg) も含めた大きい方
+    import vconvert  # noqa: F401 (読み込み時間を計測に含めない)
+    best = None
+    for _ in range(repeat):
+        t0, c0 = time.perf_counter(), time.process_time()
+        frames, size = CASES[kind](**kwargs)
+        wall, cpu = time.perf_counter() - t0, time.process_time() - c0
+        if best is None or wall < best[0]: best = (wall, cpu, frames, size)
+    rss_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    wall, cpu, frames, size = best
+    return {"wall_s": round(wall, 4), "cpu_s": round(cpu, 4), "frames": frames, "fps": round(frames / wall, 2) if wall > 0 else None,
+            "peak_rss_mb": round(max(rss_self, rss_children) / 1024, 1), "output_bytes": size}
+
+
+def build_cases(quick=False):
+    clips = {name: make_clip(name, w, h, s, fps) for name, w, h, s, fps in CLIPS if not quick or name in QUICK_CLIPS}
+    work = os.path.join(CLIP_DIR, "out")
+    os.makedirs(work, exist_ok=True)
+    cases = []
+    for name, clip in clips.items():
+        for n_wm in range(4):
+            for shadow in (False, True):
+                if n_wm == 0 and shadow: continue
+                cases.append((f"watermark/{name}/wm{n_wm}" + ("_outline" if shadow else ""), "watermark",
+                              {"clip": clip, "n_wm": n_wm, "shadow": shadow, "frames": 50 if quick else 200}))
+        cases.append((f"watermark_pil/{name}/wm3_outline", "watermark", {"clip": clip, "n_wm": 3, "shadow": True, "frames": 20 if quick else 50, "api": "pil"}))
+        cases.append((f"extract/{name}/count20", "extract", {"clip": clip, "out": os.path.join(work, f"{name}_count.zip"), "mode": "count", "value": 20}))
+        cases.append((f"extract/{name}/interval0.5", "extract", {"clip": clip, "out": os.path.join(work, f"{name}_interval.zip"), "mode": "interval", "value": 0.5}))
+        for mode in ("keyframes", "scene"):
+            cases.append((f"extract/{name}/{mode}", "extract", {"clip": clip, "out": os.path.join(work, f"{name}_{mode}.zip"), "mode": mode}))
+        for fmt in ("GIF", "WebP"):
+            cases.append((f"export/{name}/{fmt.lower()}", "export", {"clip": clip, "out": os.path.join(work, f"{name}.{fmt.lower()}"), "fmt": fmt}))
+    return cases
+
+
+def run_cases(cases, repeat=1, filters=None, log=None):
+    results = {}
+    ctx = multiprocessing.get_context("spawn")
+    for name, kind, kwargs in cases:
+        if filters and not any(f in name for f in filters): continue
+        # 1ケース1プロセス (ru_maxrss はプロセスの生涯最大値なのでケースごとに分ける)
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            results[name] = pool.submit(_run_case, kind, kwargs, repeat).result()
+        if log: log(name, results[name])
+    return results
+
+
+def compare(results, baseline, max_slowdown=0.10, max_rss_growth=0.25, max_size_growth=0.05):
+    # 悪化した項目を [(名前, 指標, ベースライン, 今回, 変化率)] で返す
+    # 処理したフレーム数がベースラインと違うケースは、経過時間ではなく fps (1秒あたりのフレーム数) の低下で比べる
+    regressions = []
+    checks = [("wall_s", max_slowdown), ("peak_rss_mb", max_rss_growth), ("output_bytes", max_size_growth)]
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if not base: continue
+        for metric, limit in checks:
+            b, c = base.get(metric), cur.get(metric)
+            if not b or c is None: continue
+            if metric == "wall_s" and base.get("frames") != cur.get("frames"):
+                b, c = base.get("fps"), cur.get("fps")
+                if not b or not c: continue
+                change = (b - c) / b
+                metric = "fps"
+            else: change = (c - b) / b
+            if change > limit: regressions.append((name, metric, b, c, round(change, 4)))
+    return regressions
+
+
+def environment():
+    import cv2
+    import numpy
+    import PIL
+    from vconvert.ffmpeg import ffmpeg_exe
+    ffmpeg_version = subprocess.run([ffmpeg_exe(), "-version"], capture_output=True, text=True).stdout.split("\n", 1)[0]
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            "numpy": numpy.__version__, "pillow": PIL.__version__, "opencv": cv2.__version__, "ffmpeg": ffmpeg_version}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="V-Convert Pro benchmarks")
+    parser.add_argument("-k", "--filter", action="append", help="run only cases whose name contains this (repeatable)")
+    parser.add_argument("--quick", action="store_true", help="smaller clips and fewer frames")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case (the fastest is reported)")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--max-slowdown", type=float, default=0.10, help="allowed wall time increase (0.10 = +10%%)")
+    parser.add_argument("--max-rss-growth", type=float, default=0.25)
+    parser.add_argument("--max-size-growth", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    def log(name, r):
+        print(f"{name:45s} {r['wall_s']:8.3f} s {r['fps'] or 0:9.1f} fps {r['peak_rss_mb']:8.1f} MB {r['output_bytes']:>10d} B", flush=True)
+
+    results = run_cases(build_cases(args.quick), args.repeat, args.filter, log)
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "environment": environment(), "quick": args.quick, "results": results}
+    with open(args.output, "w", encoding="utf-8") as f: json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f: json.dump(report, f, indent=2)
+        print(f"baseline saved: {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline} (run with --save-baseline)")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f: baseline = json.load(f)
+    # --quick とそうでない計測は同じケース名でもフレーム数や動画が違うので比べない
+    if baseline.get("quick", False) != args.quick:
+        print(f"baseline was measured {'with' if baseline.get('quick') else 'without'} --quick; rerun the same way or save a new baseline")
+        return 2
+    regressions = compare(results, baseline["results"], args.max_slowdown, args.max_rss_growth, args.max_size_growth)
+    for name, metric, b, c, change in regressions: print(f"REGRESSION {name} {metric}: {b} -> {c} ({change:+.1%})")
+    if not regressions: print("no regressions")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from vconvert import webp
+from vconvert.gif import write_gif
+
+# --- 表示時間つきフレームの書き出し ---
+# 重複除去やサムネイルで使う timed=True の経路。フレームごとの表示時間がそのまま出力に残ることを確かめる
+# (フレーム数と合計の長さだけでは、時間単位の丸めで表示時間がずれても気づけない)
+
+SIZE = (60, 40)
+DURATIONS = [
+    [0.1, 2.0, 2.0],             # サムネイル + 重複除去したスライド
+    [0.1, 2.0, 2.0, 1.5],
+    [0.5, 2.0, 2.0],
+    [0.1, 0.1, 0.1, 0.37, 0.05],
+]
+
+
+def _frames(durations):
+    return [(np.full((SIZE[1], SIZE[0], 3), i * 60 % 256, np.uint8), d) for i, d in enumerate(durations)]
+
+
+def _durations_ms(path):
+    with Image.open(path) as im:
+        out = []
+        for i in range(im.n_frames):
+            im.seek(i)
+            im.load()
+            out.append(im.info["duration"])
+    return out
+
+
+@pytest.mark.parametrize("durations", DURATIONS)
+def test_gif_frame_durations(tmp_path, durations):
+    path = str(tmp_path / "out.gif")
+    write_gif(_frames(durations), path, 10, SIZE, timed=True)
+    assert _durations_ms(path) == [round(d * 1000) for d in durations]
+
+
+@pytest.mark.parametrize("native", [True, False])
+@pytest.mark.parametrize("durations", DURATIONS)
+def test_webp_frame_durations(tmp_path, monkeypatch, durations, native):
+    if native and not webp.native_available(): pytest.skip("Pillow の WebP エンコーダが使えない")
+    if not native: monkeypatch.setattr(webp, "native_available", lambda: False)
+    path = str(tmp_path / "out.webp")
+    webp.write_webp(_frames(durations), path, 10, SIZE, timed=True)
+    assert _durations_ms(path) == [round(d * 1000) for d in durations]
@@ -0,0 +1,19 @@
+# V-Convert Pro の変換処理 (Streamlit の再実行をまたいで状態を保持するためモジュールに分離)
+from .watermark import draw_watermarks, apply_watermarks, get_font
+from .upload_store import UploadStore, get_upload_store, store_upload, store_font
+from .decoder_pool import DecoderPool, FrameCache, decoder_pool, frame_cache
+from .extract import iter_frames_at, probe_info, VideoInfo
+from .render import iter_rendered_frames, make_stream_clip, output_size, default_workers, get_process_pool
+from .gif import write_gif, write_clip_gif, DITHER_MODES, STATS_MODES
+from .zipstream import ZipImageWriter, encode_image
+from .frames import resize_frame, frame_processor, FrameRing, INTERPOLATIONS
+from .frames import fit_frame
+from .dedup import dedup_frames, timed_frames, map_timed
+from .webp import write_webp, webp_options, WEBP_PRESETS
+from .pipeline import convert_animation, extract_images, extraction_times, GIF_ENCODERS
+from .scenes import keyframe_times, select_scenes, scene_scores
+from .jobs import JobManager, QueueFullError, get_job_manager
+from .result_cache import ResultCache, get_result_cache, file_digest
+from .cli import run_batch, load_settings, expand_inputs
+from .metrics import Metrics, registry, enable_json_log, start_metrics_server
+from .preview import ProxyStore, get_proxy_store, preview_frame, preview_strip
@@ -0,0 +1,160 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# --- コマンドライン / 一括変換 ---
+# ブラウザなしで cron やキューのワーカーから変換するための入口。app.py と同じ変換処理 (pipeline) を使う。
+# 例: python -m vconvert anim videos/*.mp4 -s settings.yaml -o out --jobs 4
+# 設定ファイルのキーは pipeline の ANIMATION_DEFAULTS / EXTRACTION_DEFAULTS と同じ。
+# 結果と失敗はファイルごとに manifest.json へ書き出す。moviepy は変換を始めるまで読み込まない。
+
+VIDEO_EXTS = (".mp4", ".mov", ".avi")
+KINDS = ("anim", "image")
+# 透かしの省略した項目は画面の初期値と同じにする (pos: 0=右下, 1=左下, 2=左上, 3=右上, 4=中央)
+WATERMARK_DEFAULTS = {"text": "", "pos": 0, "color": "#FFFFFF", "size": 40, "opacity": 100, "shadow": True, "font": None}
+
+
+def load_settings(path):
+    # JSON または YAML (拡張子で判定。YAML は PyYAML が必要)
+    if path is None: return {}
+    with open(path, encoding="utf-8") as f:
+        if path.lower().endswith((".yaml", ".yml")):
+            try: import yaml
+            except ImportError: raise RuntimeError("PyYAML is required for YAML settings (pip install pyyaml)")
+            settings = yaml.safe_load(f) or {}
+        else: settings = json.load(f)
+    if not isinstance(settings, dict): raise ValueError(f"{path}: settings must be a mapping")
+    return settings
+
+
+def with_defaults(settings):
+    settings = dict(settings)
+    settings["wm_configs"] = [{**WATERMARK_DEFAULTS, **wm} for wm in settings.get("wm_configs") or []]
+    return settings
+
+
+def expand_inputs(patterns):
+    # ファイル / ディレクトリ (直下の動画) / glob を展開する。重複は除き、指定順を保つ
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            found = sorted(os.path.join(pattern, n) for n in os.listdir(pattern) if n.lower().endswith(VIDEO_EXTS))
+        elif os.path.isfile(pattern): found = [pattern]
+        else: found = sorted(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+        for p in found:
+            if p not in paths: paths.append(p)
+    return paths
+
+
+def _output_ext(kind, settings):
+    if kind == "anim": return "." + str(settings.get("format", "GIF")).lower()
+    return ".zip"
+
+
+def _output_paths(kind, inputs, out_dir, settings):
+    # 出力名は 入力名 + 拡張子。同じ名前があれば連番を付ける
+    ext, used, outs = _output_ext(kind, settings), set(), []
+    for path in inputs:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name, n = stem + ext, 1
+        while name in used: n += 1; name = f"{stem}_{n}{ext}"
+        used.add(name)
+        outs.append(os.path.join(out_dir, name))
+    return outs
+
+
+def convert_file(kind, video_path, out_path, settings, use_cache=True):
+    # ワーカープロセスで実行される。1ファイル分の結果を manifest の1行として返す
+    from .decoder_pool import decoder_pool
+    from .metrics import Metrics
+    from .pipeline import convert_animation, extract_images
+    from .result_cache import get_result_cache
+    cache = get_result_cache() if use_cache else None
+    hits = cache.hits if cache else 0
+    entry = {"input": video_path, "output": out_path, "status": "ok", "error": None}
+    metrics = Metrics()
+    t0 = time.perf_counter()
+    try:
+        func = convert_animation if kind == "anim" else extract_images
+        func(video_path, out_path, settings, cache=cache, metrics=metrics)
+        entry["bytes"] = os.path.getsize(out_path)
+        entry["cached"] = bool(cache and cache.hits > hits)
+    except Exception as e:
+        entry.update(status="failed", error=f"{type(e).__name__}: {e}")
+    finally:
+        decoder_pool.close_all()
+    entry["seconds"] = round(time.perf_counter() - t0, 3)
+    entry["stages"] = metrics.summary()["stages"]
+    return entry
+
+
+def run_batch(kind, inputs, out_dir, settings=None, jobs=1, manifest_path=None, use_cache=True, log=None):
+    # inputs をファイルごとに変換し、manifest (dict) を返す。jobs はプロセス数の上限
+    if kind not in KINDS: raise ValueError(f"unknown kind: {kind}")
+    settings = with_defaults(settings or {})
+    paths = expand_inputs(inputs)
+    os.makedirs(out_dir, exist_ok=True)
+    outs = _output_paths(kind, paths, out_dir, settings)
+    manifest = {"kind": kind, "settings": settings, "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "results": []}
+    results = [None] * len(paths)
+    t0 = time.perf_counter()
+    if jobs <= 1 or len(paths) <= 1:
+        for i, (path, out) in enumerate(zip(paths, outs)):
+            results[i] = convert_file(kind, path, out, settings, use_cache)
+            if log: log(results[i])
+    else:
+        # 各プロセスで ffmpeg を起動するので、スレッドを持つ親から安全に起動できる spawn を使う
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(jobs, len(paths)), mp_context=ctx) as pool:
+            futures = {pool.submit(convert_file, kind, path, out, settings, use_cache): i for i, (path, out) in enumerate(zip(paths, outs))}
+            for fut in as_completed(futures):
+                i = futures[fut]
+                try: results[i] = fut.result()
+                except Exception as e: # ワーカープロセス自体が落ちた場合
+                    results[i] = {"input": paths[i], "output": outs[i], "status": "failed", "error": f"{type(e).__name__}: {e}"}
+                if log: log(results[i])
+    manifest["results"] = results
+    manifest["ok"] = sum(1 for r in results if r["status"] == "ok")
+    manifest["failed"] = len(results) - manifest["ok"]
+    manifest["seconds"] = round(time.perf_counter() - t0, 3)
+    manifest_path = manifest_path or os.path.join(out_dir, "manifest.json")
+    with open(manifest_path, "w", encoding="utf-8") as f: json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def _parse_value(text):
+    try: return json.loads(text)
+    except ValueError: return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="vconvert", description="V-Convert Pro batch converter")
+    parser.add_argument("kind", choices=KINDS, help="anim: GIF/WebP, image: still images (ZIP)")
+    parser.add_argument("inputs", nargs="+", help="video files, directories or glob patterns")
+    parser.add_argument("-s", "--settings", help="settings file (.json / .yaml)")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="override a setting (value is parsed as JSON)")
+    parser.add_argument("-o", "--out-dir", default="vconvert_out")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="max parallel processes")
+    parser.add_argument("--manifest", help="manifest path (default: OUT_DIR/manifest.json)")
+    parser.add_argument("--no-cache", action="store_true", help="do not use the result cache")
+    args = parser.parse_args(argv)
+
+    settings = load_settings(args.settings)
+    for item in args.set:
+        key, sep, value = item.partition("=")
+        if not sep: parser.error(f"--set expects KEY=VALUE: {item}")
+        settings[key] = _parse_value(value)
+    if not expand_inputs(args.inputs): parser.error("no input videos found")
+
+    def log(entry):
+        if entry["status"] == "ok": print(f"ok     {entry['input']} -> {entry['output']} ({entry['seconds']} s)", file=sys.stderr)
+        else: print(f"failed {entry['input']}: {entry['error'].splitlines()[0]}", file=sys.stderr) # 全文は manifest に残る
+
+    manifest = run_batch(args.kind, args.inputs, args.out_dir, settings, args.jobs, args.manifest, not args.no_cache, log)
+    print(f"{manifest['ok']} ok, {manifest['failed']} failed", file=sys.stderr)
+    return 1 if manifest["failed"] else 0
@@ -0,0 +1,210 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+# --- デコーダプール ---
+# VideoFileClip (ffmpeg のプローブ + 読み込みプロセス) をファイルごとに使い回す。
+# 同時に開く ffmpeg の数に上限を設け、一定時間使われなかったものは自動で閉じる。
+# 画面 (Streamlit のセッション) は読み込みプロセスを借りない (メタデータは extract.probe_info、フレームは frame_cache を使う)。
+# 借り続けるセッションがあると上限に達したときに変換ジョブが待たされるため。
+
+
+def _open_clip(path):
+    from moviepy.editor import VideoFileClip
+    return VideoFileClip(path, audio=False)
+
+
+def _alive(clip):
+    reader = getattr(clip, "reader", None)
+    return reader is not None and getattr(reader, "proc", None) is not None
+
+
+def _close(clip):
+    try: clip.close()
+    except Exception: pass
+
+
+class DecoderPool:
+    def __init__(self, max_open=8, idle_timeout=120.0, lease_timeout=900.0, open_timeout=60.0):
+        self.max_open = max_open
+        self.idle_timeout = idle_timeout
+        self.lease_timeout = lease_timeout
+        self.open_timeout = open_timeout
+        self._cond = threading.Condition()
+        self._idle = {}    # path -> [(clip, last_used), ...]
+        self._leases = {}  # owner -> [path, clip, last_used]
+        self._open = 0
+        self._reaper = None
+
+    def acquire(self, path, owner=None, pinned=False):
+        # owner を省略した場合は release(clip=...) で返却すること
+        # pinned=True の貸し出しは lease_timeout で回収しない (必ず release する呼び出し側用)
+        owner = owner if owner is not None else object()
+        with self._cond:
+            self._start_reaper()
+            lease = self._leases.get(owner)
+            if lease is not None:
+                if lease[0] == path and _alive(lease[1]):
+                    lease[2] = time.monotonic()
+                    return lease[1]
+                self._release_locked(owner)
+
+            deadline = time.monotonic() + self.open_timeout
+            while True:
+                self._reap_locked()
+                idle = self._idle.get(path)
+                while idle:
+                    clip, _ = idle.pop()
+                    if _alive(clip):
+                        self._leases[owner] = [path, clip, None if pinned else time.monotonic()]
+                        return clip
+                    self._discard_locked(clip)
+                if self._open < self.max_open or self._evict_idle_locked():
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0: raise RuntimeError("ffmpeg reader limit reached")
+                self._cond.wait(min(remaining, 1.0))
+
+        # プローブは時間がかかるのでロックの外で開く
+        try: clip = _open_clip(path)
+        except BaseException:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._leases[owner] = [path, clip, None if pinned else time.monotonic()]
+        return clip
+
+    def release(self, owner=None, clip=None):
+        with self._cond:
+            if owner is None and clip is not None:
+                owner = next((o for o, l in self._leases.items() if l[1] is clip), None)
+            if owner in self._leases: self._release_locked(owner)
+
+    @contextmanager
+    def lease(self, path):
+        # with ブロックの間だけ専有する (長い変換ジョブでも途中で回収されない)
+        owner = object()
+        clip = self.acquire(path, owner, pinned=True)
+        try: yield clip
+        finally: self.release(owner)
+
+    def close_all(self):
+        with self._cond:
+            for owner in list(self._leases): self._release_locked(owner)
+            for path in list(self._idle):
+                for clip, _ in self._idle.pop(path): self._discard_locked(clip)
+
+    def stats(self):
+        with self._cond:
+            return {"open": self._open, "leased": len(self._leases), "idle": sum(len(v) for v in self._idle.values())}
+
+    # --- 以下はロック取得済みで呼ぶ ---
+    def _release_locked(self, owner):
+        path, clip, _ = self._leases.pop(owner)
+        if _alive(clip): self._idle.setdefault(path, []).append((clip, time.monotonic()))
+        else: self._discard_locked(clip)
+        self._cond.notify()
+
+    def _discard_locked(self, clip):
+        _close(clip)
+        self._open -= 1
+        self._cond.notify()
+
+    def _evict_idle_locked(self):
+        oldest = None
+        for path, idle in self._idle.items():
+            for i, (clip, used) in enumerate(idle):
+                if oldest is None or used < oldest[2]: oldest = (path, i, used)
+        if oldest is None: return False
+        clip, _ = self._idle[oldest[0]].pop(oldest[1])
+        if not self._idle[oldest[0]]: del self._idle[oldest[0]]
+        self._discard_locked(clip)
+        return True
+
+    def _reap_locked(self):
+        now = time.monotonic()
+        for owner, (path, clip, used) in list(self._leases.items()):
+            if used is not None and now - used > self.lease_timeout: self._release_locked(owner)
+        for path in list(self._idle):
+            keep = []
+            for clip, used in self._idle[path]:
+                if now - used > self.idle_timeout: self._discard_locked(clip)
+                else: keep.append((clip, used))
+            if keep: self._idle[path] = keep
+            else: del self._idle[path]
+
+    def _start_reaper(self):
+        if self._reaper is not None: return
+        def loop():
+            while True:
+                time.sleep(max(1.0, min(self.idle_timeout / 2, 30.0)))
+                with self._cond: self._reap_locked()
+        self._reaper = threading.Thread(target=loop, name="vconvert-decoder-reaper", daemon=True)
+        self._reaper.start()
+
+
+# --- フレームキャッシュ ---
+# デコード済みフレームを (ファイル, 時刻, サイズ) で保持する。合計バイト数で上限を管理する LRU。
+
+class FrameCache:
+    def __init__(self, max_bytes=512 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._frames = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(path, t, size=None):
+        return (path, round(float(t), 3), tuple(size) if size else None)
+
+    def get(self, key):
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return frame
+
+    def put(self, key, frame):
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        frame.flags.writeable = False  # キャッシュ内の配列は共有されるので読み取り専用にする
+        if frame.nbytes > self.max_bytes: return frame
+        with self._lock:
+            old = self._frames.pop(key, None)
+            if old is not None: self._bytes -= old.nbytes
+            self._frames[key] = frame
+            self._bytes += frame.nbytes
+            while self._bytes > self.max_bytes:
+                _, f = self._frames.popitem(last=False)
+                self._bytes -= f.nbytes
+        return frame
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._bytes = 0
+
+    def get_frame(self, clip, path, t, size=None):
+        # size=(幅, 高さ) を指定すると縮小後のフレームをキャッシュする
+        key = self.key(path, t, size)
+        frame = self.get(key)
+        if frame is not None: return frame
+        frame = clip.get_frame(t)
+        if size:
+            from .frames import resize_frame
+            frame = resize_frame(frame, size)
+        return self.put(key, frame)
+
+
+decoder_pool = DecoderPool()
+frame_cache = FrameCache()
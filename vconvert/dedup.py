@@ -0,0 +1,43 @@
+import cv2
+import numpy as np
+
+# --- 重複フレームの除去 ---
+# 連続するフレームを縮小版どうしで比較し、差が許容値以下なら前のフレームの表示時間に合算する。
+# 出力は (フレーム, 表示時間[秒]) の組。GIF/WebP では可変のフレーム長として書き出す。
+
+
+def _signature(frame, scale):
+    # 縮小 (INTER_AREA でブロック平均) した int16 配列。小さな変化 (マウスカーソルなど) もブロック平均に残る
+    h, w = frame.shape[:2]
+    small = cv2.resize(frame, (max(1, w // scale), max(1, h // scale)), interpolation=cv2.INTER_AREA)
+    return small.astype(np.int16)
+
+
+def is_duplicate(sig_a, sig_b, tolerance):
+    return int(np.abs(sig_a - sig_b).max()) <= tolerance
+
+
+def dedup_frames(frames, fps, tolerance=2, scale=4):
+    # frames: 一定 fps のフレーム列。tolerance は縮小後の画素値 (0-255) の最大差。0 なら完全一致のみ
+    step = 1.0 / fps
+    prev, prev_sig, duration = None, None, 0.0
+    for frame in frames:
+        sig = _signature(frame, scale) if tolerance > 0 else None
+        if prev is not None:
+            same = np.array_equal(frame, prev) if tolerance <= 0 else is_duplicate(sig, prev_sig, tolerance)
+            if same:
+                duration += step
+                continue
+            yield prev, duration
+        prev, prev_sig, duration = frame, sig, step
+    if prev is not None: yield prev, duration
+
+
+def timed_frames(frames, fps):
+    # 重複除去をしない場合の (フレーム, 表示時間) 列
+    step = 1.0 / fps
+    for frame in frames: yield frame, step
+
+
+def map_timed(func, timed):
+    for frame, duration in timed: yield func(frame), duration
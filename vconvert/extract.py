@@ -0,0 +1,136 @@
+import os
+import subprocess
+import tempfile
+from fractions import Fraction
+from functools import lru_cache
+
+import numpy as np
+
+from .ffmpeg import ffmpeg_exe, popen_kwargs, read_exact, readinto_exact, stop_process
+from .frames import FrameRing, ffmpeg_scale_flags
+
+# --- 静止画抽出エンジン ---
+# 指定された時刻のフレームを ffmpeg の1回の前方デコードでまとめて取り出す。
+# 不要なフレームは select フィルタで捨ててから縮小・RGB 変換するので、間引かれたフレームには変換コストがかからない。
+# 時刻の選び方は moviepy の get_frame と同じ (t 以前で最後のフレーム) で、ずれても1フレーム以内。
+
+SELECT_LIMIT = 1000  # select 式に並べるフレーム番号の上限 (式が長くなりすぎるのを防ぐ)
+
+
+def _uniform_step(times):
+    if len(times) < 2: return None
+    d = np.diff(times)
+    step = float(d.mean())
+    if step <= 0 or not np.allclose(d, step, rtol=1e-6, atol=1e-9): return None
+    return step
+
+
+def _frame_filter(times, src_fps, n0=0):
+    # 返り値: (select フィルタ, times の各要素が何番目の出力フレームに当たるか)
+    # moviepy と同じく時刻 t のフレーム番号は int(fps * t) とする。n0 はシーク後の先頭フレーム番号
+    step = _uniform_step(times)
+    if step is not None and float(times[0]) == 0.0 and n0 == 0:
+        # 等間隔: k 番目のフレーム番号は floor(k * P / Q)。整数演算の式なので要素数によらず短い
+        r = Fraction(src_fps * step + 1e-9).limit_denominator(1000000)
+        P, Q, K = r.numerator, r.denominator, len(times)
+        idx = [k * P // Q for k in range(K)]
+        expr = f"lt(ceil(n*{Q}/{P})*{P}\\,(n+1)*{Q})*lte(ceil(n*{Q}/{P})\\,{K - 1})"
+    else:
+        idx = [int(src_fps * t + 0.00001) for t in times]
+        if len(set(idx)) > SELECT_LIMIT: raise ValueError("too many irregular timestamps")
+        expr = "+".join(f"eq(n\\,{n - n0})" for n in sorted(set(idx)))
+    # 同じフレームを指す時刻があれば後で複製する
+    uniq = sorted(set(idx))
+    pos = {n: i for i, n in enumerate(uniq)}
+    return f"select='{expr}'", [pos[n] for n in idx]
+
+
+def iter_frames_at(path, times, size=None, src_fps=None, interpolation="lanczos", threads=0, seek=False,
+                   src_size=None, buffers=0):
+    # times: 昇順の時刻 (秒)。size=(幅, 高さ) を指定するとデコード時に縮小する (interpolation は frames.INTERPOLATIONS の名前)
+    # seek=True なら先頭の時刻までシークしてからデコードする (区間ごとの処理向け)
+    # buffers > 0 ならその数のバッファを使い回す。返したフレームは buffers 枚後に上書きされるので、それ以上保持しないこと
+    # 戻り値: times と同じ順で HxWx3 uint8 の ndarray を返すジェネレータ
+    times = np.asarray(times, dtype=float)
+    if len(times) == 0: return
+    if np.any(np.diff(times) < 0): raise ValueError("times must be sorted")
+    if not src_fps: src_fps = probe_fps(path)
+    n0 = int(src_fps * times[0] + 0.00001) if seek else 0
+    # 先頭に欲しいフレームの半フレーム手前へシークすると、出力の最初がちょうどそのフレームになる
+    ss = ["-ss", f"{(n0 - 0.5) / src_fps:.6f}"] if n0 > 0 else []
+    vf, order = _frame_filter(times, src_fps, n0)
+    filters = [vf]
+    if size:
+        src_size = src_size or probe_size(path)
+        flags = ffmpeg_scale_flags(interpolation, src_size, size)
+        filters.append(f"scale={int(size[0])}:{int(size[1])}:flags={flags}")
+    filters.append("format=rgb24")
+
+    w, h = (int(size[0]), int(size[1])) if size else (src_size or probe_size(path))
+    ring = FrameRing((h, w, 3), buffers) if buffers > 0 else None
+    frame_bytes = w * h * 3
+    n_out = order[-1] + 1
+    cmd = [ffmpeg_exe(), "-nostdin", "-v", "error", "-threads", str(threads), *ss, "-i", path,
+           "-an", "-sn", "-vf", ",".join(filters), "-fps_mode", "passthrough",
+           "-frames:v", str(n_out), "-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"]
+    err = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=err,
+                            bufsize=frame_bytes, **popen_kwargs())
+    try:
+        # 出力フレームを順に読み、対応する時刻の分だけ返す (同じフレームが続く場合は複製)
+        last, produced, i = None, 0, 0
+        while i < len(order):
+            if produced <= order[i]:
+                if ring is not None:
+                    buf = ring.get()
+                    if not readinto_exact(proc.stdout, buf): break
+                    last = buf
+                else:
+                    buf = read_exact(proc.stdout, frame_bytes)
+                    if buf is None: break
+                    last = np.frombuffer(buf, dtype=np.uint8).reshape(h, w, 3)
+                produced += 1
+                continue
+            yield last
+            i += 1
+        if last is None:
+            proc.wait()
+            err.seek(0)
+            raise RuntimeError(f"ffmpeg frame extraction failed: {err.read().decode(errors='replace').strip()}")
+        # 末尾で ffmpeg の出力が足りない場合は最後のフレームで埋める (moviepy と同じ挙動)
+        for _ in range(len(order) - i): yield last
+    finally:
+        stop_process(proc)
+        err.close()
+
+
+class VideoInfo:
+    # VideoFileClip と同じ名前のメタデータだけを持つ (読み込みプロセスを開かない)
+    def __init__(self, duration, fps, size):
+        self.duration, self.fps = duration, fps
+        self.size = tuple(size)
+        self.w, self.h = self.size
+
+
+@lru_cache(maxsize=64)
+def _probe_info(path, mtime_ns, nbytes):
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+    infos = ffmpeg_parse_infos(path)
+    w, h = infos["video_size"]
+    # moviepy と同じく回転メタデータがあれば縦横を入れ替える
+    if infos.get("video_rotation", 0) in (90, 270): w, h = h, w
+    return VideoInfo(infos["video_duration"], infos["video_fps"], (w, h))
+
+
+def probe_info(path):
+    # ファイルが変わらない限りプローブは1回 (Streamlit の再実行ごとに ffmpeg を起動しない)
+    st = os.stat(path)
+    return _probe_info(path, st.st_mtime_ns, st.st_size)
+
+
+def probe_fps(path):
+    return probe_info(path).fps
+
+
+def probe_size(path):
+    return probe_info(path).size
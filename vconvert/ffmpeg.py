@@ -0,0 +1,100 @@
+import os
+import subprocess
+import tempfile
+from functools import lru_cache
+
+import numpy as np
+
+# --- ffmpeg 呼び出しの共通処理 ---
+
+
+@lru_cache(maxsize=1)
+def ffmpeg_exe():
+    # moviepy と同じく環境変数 FFMPEG_BINARY を優先し、なければ imageio-ffmpeg 同梱のものを使う
+    exe = os.environ.get("FFMPEG_BINARY")
+    if exe and exe != "ffmpeg-imageio": return exe
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return "ffmpeg"
+
+
+def popen_kwargs():
+    # Windows でコンソールウィンドウを開かない
+    if os.name == "nt": return {"creationflags": 0x08000000}
+    return {}
+
+
+def read_exact(stream, nbytes):
+    # パイプから nbytes 読み切るまで読む。途中で終わった場合は None
+    buf = bytearray(nbytes)
+    view = memoryview(buf)
+    got = 0
+    while got < nbytes:
+        n = stream.readinto(view[got:])
+        if not n: return None
+        got += n
+    return buf
+
+
+def readinto_exact(stream, buf):
+    # 書き込み可能なバッファ (ndarray など) をパイプからのデータで埋める。途中で終わった場合は False
+    view = memoryview(buf).cast("B")
+    got, nbytes = 0, view.nbytes
+    while got < nbytes:
+        n = stream.readinto(view[got:])
+        if not n: return False
+        got += n
+    return True
+
+
+def stop_process(proc):
+    for s in (proc.stdin, proc.stdout):
+        try:
+            if s: s.close()
+        except Exception: pass
+    if proc.poll() is None:
+        proc.terminate()
+        try: proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def encode_frames(frames, size, output_args, fps=None, timed=False, what="encoding"):
+    # フレームをパイプで ffmpeg に渡してエンコードする。
+    # timed=False: frames は HxWx3 uint8 の ndarray 列 (一定 fps の rawvideo として渡す)
+    # timed=True: frames は (ndarray, 表示時間[秒]) の列 (Matroska で時刻付きで渡す)
+    from .mkvpipe import MkvFrameWriter
+    w, h = int(size[0]), int(size[1])
+    if timed: input_args = ["-f", "matroska", "-i", "pipe:0"]
+    else: input_args = ["-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{w}x{h}", "-framerate", str(fps), "-i", "pipe:0"]
+    cmd = [ffmpeg_exe(), "-v", "error", *input_args, *output_args]
+    err = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=err, **popen_kwargs())
+    try:
+        n = 0
+        try:
+            if timed:
+                writer = MkvFrameWriter(proc.stdin, (w, h))
+                for frame, duration in frames:
+                    writer.write(frame, duration)
+                    n += 1
+            else:
+                for frame in frames:
+                    frame = np.ascontiguousarray(frame, dtype=np.uint8)
+                    if frame.shape != (h, w, 3): raise ValueError(f"frame size {frame.shape[1]}x{frame.shape[0]} != {w}x{h}")
+                    proc.stdin.write(memoryview(frame).cast("B"))
+                    n += 1
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        ret = proc.wait()
+        if ret != 0 or n == 0:
+            err.seek(0)
+            raise RuntimeError(f"{what} failed: {err.read().decode(errors='replace').strip() or 'no frames'}")
+        return n
+    finally:
+        stop_process(proc)
+        err.close()
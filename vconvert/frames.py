@@ -0,0 +1,83 @@
+import cv2
+import numpy as np
+
+# --- フレーム処理 ---
+# フレームは常に C 連続の HxWx3 uint8 ndarray のまま扱い、PIL との往復をしない。
+# リサイズは OpenCV で行い、出力先の配列を渡せば新しい配列を確保しない。
+
+INTERPOLATIONS = {
+    "auto": None,  # 縮小は INTER_AREA、拡大は INTER_LINEAR (moviepy と同じ)
+    "area": cv2.INTER_AREA,
+    "linear": cv2.INTER_LINEAR,
+    "cubic": cv2.INTER_CUBIC,
+    "lanczos": cv2.INTER_LANCZOS4,
+    "nearest": cv2.INTER_NEAREST,
+}
+
+# デコード時に ffmpeg で縮小する場合の対応するフラグ
+FFMPEG_SCALE_FLAGS = {"area": "area", "linear": "bilinear", "cubic": "bicubic", "lanczos": "lanczos", "nearest": "neighbor"}
+
+
+def _cv2_flag(interpolation, src_size, dst_size):
+    flag = INTERPOLATIONS[interpolation]
+    if flag is not None: return flag
+    if dst_size[0] > src_size[0] or dst_size[1] > src_size[1]: return cv2.INTER_LINEAR
+    return cv2.INTER_AREA
+
+
+def ffmpeg_scale_flags(interpolation, src_size, dst_size):
+    if interpolation == "auto":
+        interpolation = "linear" if dst_size[0] > src_size[0] or dst_size[1] > src_size[1] else "area"
+    return FFMPEG_SCALE_FLAGS[interpolation]
+
+
+def as_frame(frame):
+    # C 連続の uint8 配列にする (すでにそうならコピーしない)
+    return np.ascontiguousarray(frame, dtype=np.uint8)
+
+
+def resize_frame(frame, size, interpolation="auto", out=None):
+    # size=(幅, 高さ)。out を渡すとそこへ書き込む (同じサイズなら out へコピー)
+    w, h = int(size[0]), int(size[1])
+    src = as_frame(frame)
+    if (src.shape[1], src.shape[0]) == (w, h):
+        if out is None: return src
+        out[...] = src
+        return out
+    flag = _cv2_flag(interpolation, (src.shape[1], src.shape[0]), (w, h))
+    if out is None: return cv2.resize(src, (w, h), interpolation=flag)
+    return cv2.resize(src, (w, h), dst=out, interpolation=flag)
+
+
+class FrameRing:
+    # 同じ形のフレームバッファを使い回すリング。返したバッファは n 回後の get() で再利用される
+    def __init__(self, shape, n=2):
+        self._buffers = [np.empty(shape, dtype=np.uint8) for _ in range(max(1, n))]
+        self._i = 0
+
+    def get(self):
+        buf = self._buffers[self._i]
+        self._i = (self._i + 1) % len(self._buffers)
+        return buf
+
+
+def frame_processor(size, wm_configs=None, interpolation="auto"):
+    # moviepy の fl_image 用: リサイズと透かしを1回の処理で行う。リサイズ後の配列にそのまま透かしを描く
+    from .watermark import apply_watermarks
+    def process(frame):
+        out = resize_frame(frame, size, interpolation)
+        if wm_configs: out = apply_watermarks(out, wm_configs, inplace=out is not frame)
+        return out
+    return process
+
+
+def fit_frame(frame, size, interpolation="auto"):
+    # 縦横比を保って size に収まるよう縮小し、黒い背景の中央に置く (サムネイル画像用)
+    w, h = int(size[0]), int(size[1])
+    src = as_frame(frame)
+    scale = min(w / src.shape[1], h / src.shape[0])
+    fw, fh = max(1, round(src.shape[1] * scale)), max(1, round(src.shape[0] * scale))
+    out = np.zeros((h, w, 3), dtype=np.uint8)
+    x, y = (w - fw) // 2, (h - fh) // 2
+    out[y:y + fh, x:x + fw] = resize_frame(src, (fw, fh), interpolation)
+    return out
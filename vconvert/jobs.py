@@ -0,0 +1,153 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import Metrics, registry
+
+# --- バックグラウンドジョブ ---
+# 変換処理を Streamlit のリクエストスレッドから切り離し、上限付きのワーカーで実行する。
+# ジョブごとに専用の作業ディレクトリを作り、出力はすべてそこに書く (ユーザー間でファイルを共有しない)。
+# 画面は job_id でステータスと進捗を取得して表示する。終了後 ttl 秒たったジョブはディレクトリごと削除する。
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class Job:
+    def __init__(self, kind, root):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.dir = os.path.join(root, self.id)
+        os.makedirs(self.dir)
+        self.status = QUEUED
+        self.progress = 0
+        self.message = None  # 画面の文言辞書のキー
+        self.result = None
+        self.error = None
+        self.traceback = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.metrics = Metrics()  # 変換処理に渡す (工程ごとの時間と残り時間)
+        self._done = threading.Event()
+
+    def path(self, name):
+        # ジョブの作業ディレクトリ内のパス
+        return os.path.join(self.dir, name)
+
+    def update(self, percent, message=None):
+        # 変換処理の progress コールバック
+        self.progress = max(0, min(100, int(percent)))
+        if message is not None: self.message = message
+
+    def wait(self, timeout=None):
+        # 終了するか timeout 秒たつまで待つ
+        return self._done.wait(timeout)
+
+    @property
+    def done(self):
+        return self.status in (DONE, FAILED)
+
+    def eta(self):
+        return None if self.status != RUNNING else self.metrics.eta()
+
+
+class JobManager:
+    def __init__(self, max_workers=2, max_queue=8, ttl=3600.0, root=None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.ttl = ttl
+        self.root = root or os.path.join(tempfile.gettempdir(), "vconvert_jobs")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="vconvert-job")
+        self._reaper = None
+        os.makedirs(self.root, exist_ok=True)
+
+    def submit(self, kind, func, *args, **kwargs):
+        # func(job, *args, **kwargs) をワーカーで実行し、戻り値を job.result に入れる
+        with self._lock:
+            self._start_reaper()
+            self._cleanup_locked()
+            active = sum(1 for j in self._jobs.values() if not j.done)
+            if active >= self.max_workers + self.max_queue: raise QueueFullError("job queue is full")
+            job = Job(kind, self.root)
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for j in self._jobs.values(): counts[j.status] += 1
+            return counts
+
+    def cleanup(self):
+        with self._lock: self._cleanup_locked()
+
+    def _run(self, job, func, args, kwargs):
+        job.started = time.time()
+        job.metrics.created = time.monotonic()  # 待ち時間は含めない
+        job.status = RUNNING
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.progress = 100
+            status = DONE
+        except Exception as e:
+            job.error = f"{e}" or type(e).__name__
+            job.traceback = traceback.format_exc()
+            status = FAILED
+        # finished を先に入れてから終了状態にする (削除処理が終了時刻を参照するため)
+        job.finished = time.time()
+        job.status = status
+        job._done.set()
+        registry.record(job.kind, status, job.metrics, {"job_id": job.id, "queued_s": round(job.started - job.created, 3), "error": job.error})
+
+    # --- 以下はロック取得済みで呼ぶ ---
+    def _cleanup_locked(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.done and now - job.finished > self.ttl:
+                del self._jobs[job_id]
+                shutil.rmtree(job.dir, ignore_errors=True)
+        # 以前のプロセスが残した作業ディレクトリも削除する
+        for name in os.listdir(self.root):
+            if name in self._jobs: continue
+            p = os.path.join(self.root, name)
+            try:
+                if now - os.stat(p).st_mtime > self.ttl: shutil.rmtree(p, ignore_errors=True)
+            except OSError: pass
+
+    def _start_reaper(self):
+        if self._reaper is not None: return
+        def loop():
+            while True:
+                time.sleep(max(1.0, min(self.ttl / 2, 60.0)))
+                self.cleanup()
+        self._reaper = threading.Thread(target=loop, name="vconvert-job-reaper", daemon=True)
+        self._reaper.start()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+            registry.add_collector(lambda: [("vconvert_jobs", {"status": k}, v) for k, v in _manager.stats().items()])
+        return _manager
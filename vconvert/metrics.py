@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- 計測 ---
+# 変換の工程 (decode / resize / watermark / thumbnail / encode / zip など) ごとに
+# 経過時間・CPU 時間・フレーム数・最大メモリを記録する。工程は入れ子にでき、時間は内側の工程を除いた分だけ数える
+# (ストリーム処理ではエンコーダがフレームを要求するたびにデコード等が走るため)。
+# CPU 時間は変換スレッド自身のもので、ffmpeg やワーカープロセスの分は含まない。メモリはプロセス全体の RSS。
+# 同じ Metrics がフレーム単位の進捗と残り時間も計算する。終了したジョブは JSON ログと Prometheus 形式の集計に出す。
+
+PROGRESS_SPAN = 95  # フレームの進捗は 95% まで。残りはエンコーダの書き出し完了
+RSS_SAMPLE_INTERVAL = 0.2
+logger = logging.getLogger("vconvert.metrics")
+
+
+def current_rss():
+    # 現在の RSS (バイト)。/proc がなければ最大 RSS で代用する
+    try:
+        with open("/proc/self/statm") as f: return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except ImportError: return 0
+
+
+class Metrics:
+    def __init__(self):
+        self.stages = {}  # 工程名 -> {"wall_s", "cpu_s", "frames", "calls", "peak_rss"}
+        self._stack = []  # [工程名, 再開した時刻, 再開した CPU 時間]
+        self.created = time.monotonic()
+        self.total = 0
+        self.done = 0
+        self._progress = None
+        self._message = None
+        self._count_started = None
+        self._rss_sampled = 0.0
+
+    def _get(self, name):
+        st = self.stages.get(name)
+        if st is None: st = self.stages[name] = {"wall_s": 0.0, "cpu_s": 0.0, "frames": 0, "calls": 0, "peak_rss": 0}
+        return st
+
+    def _charge(self, entry, now, cpu):
+        st = self._get(entry[0])
+        st["wall_s"] += now - entry[1]
+        st["cpu_s"] += cpu - entry[2]
+        entry[1], entry[2] = now, cpu
+
+    def _sample_rss(self, st, now):
+        if now - self._rss_sampled < RSS_SAMPLE_INTERVAL and st["peak_rss"]: return
+        self._rss_sampled = now
+        st["peak_rss"] = max(st["peak_rss"], current_rss())
+
+    @contextmanager
+    def stage(self, name):
+        now, cpu = time.monotonic(), time.thread_time()
+        if self._stack: self._charge(self._stack[-1], now, cpu)  # 外側の工程を止める
+        self._stack.append([name, now, cpu])
+        try: yield self
+        finally:
+            now, cpu = time.monotonic(), time.thread_time()
+            entry = self._stack.pop()
+            self._charge(entry, now, cpu)
+            st = self._get(name)
+            st["calls"] += 1
+            self._sample_rss(st, now)
+            if self._stack: self._stack[-1][1], self._stack[-1][2] = now, cpu  # 外側の工程を再開
+
+    def add_frames(self, name, n=1):
+        self._get(name)["frames"] += n
+
+    def iter_stage(self, name, iterable):
+        # iterable から1つ取り出すごとに name の工程として数える
+        it = iter(iterable)
+        while True:
+            with self.stage(name):
+                try: item = next(it)
+                except StopIteration: return
+            self._get(name)["frames"] += 1
+            yield item
+
+    # --- 進捗 ---
+    def start(self, total, progress=None, message=None):
+        # total: 処理するフレーム数。progress(パーセント, ステータスのキー) に通知する
+        # 工程が変わるたびに呼ばれる (シーン解析 → 抽出、目標サイズのやり直しなど)。残り時間は新しい工程の最初のフレームから測り直す
+        self.total, self.done, self._count_started = int(total), 0, None
+        self._progress, self._message = progress, message
+        if progress: progress(0, message)
+
+    def count(self, iterable):
+        # 通過したフレーム数で進捗を進める
+        for item in iterable:
+            if self._count_started is None: self._count_started = time.monotonic()
+            self.done += 1
+            if self._progress: self._progress(self.percent(), self._message)
+            yield item
+
+    def percent(self):
+        if self.total <= 0: return 0
+        return int(PROGRESS_SPAN * min(self.done, self.total) / self.total)
+
+    def eta(self):
+        # 残りフレームにかかる秒数の見込み (まだ分からなければ None)
+        if not self.done or self._count_started is None or self.total <= 0: return None
+        elapsed = time.monotonic() - self._count_started
+        return max(0.0, elapsed / self.done * (self.total - self.done))
+
+    def summary(self):
+        return {"wall_s": round(time.monotonic() - self.created, 4), "frames_done": self.done, "frames_total": self.total,
+                "stages": {name: {"wall_s": round(st["wall_s"], 4), "cpu_s": round(st["cpu_s"], 4), "frames": st["frames"],
+                                  "calls": st["calls"], "peak_rss_mb": round(st["peak_rss"] / 1024 ** 2, 1)}
+                           for name, st in self.stages.items()}}
+
+
+# --- 集計 (Prometheus 形式) ---
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}    # (kind, status) -> 件数
+        self._seconds = {} # kind -> [合計秒数, 件数]
+        self._stages = {}  # (kind, stage) -> [wall, cpu, frames]
+        self._collectors = []
+
+    def record(self, kind, status, metrics, extra=None):
+        # 終了したジョブを集計に加え、1行の JSON ログを出す
+        summary = metrics.summary()
+        with self._lock:
+            self._jobs[(kind, status)] = self._jobs.get((kind, status), 0) + 1
+            sec = self._seconds.setdefault(kind, [0.0, 0])
+            sec[0] += summary["wall_s"]; sec[1] += 1
+            for name, st in summary["stages"].items():
+                acc = self._stages.setdefault((kind, name), [0.0, 0.0, 0])
+                acc[0] += st["wall_s"]; acc[1] += st["cpu_s"]; acc[2] += st["frames"]
+        logger.info(json.dumps({"event": "job_finished", "kind": kind, "status": status, **(extra or {}), **summary}, ensure_ascii=False))
+
+    def add_collector(self, func):
+        # func() は [(メトリクス名, {ラベル}, 値), ...] を返す (キャッシュやキューの現在値など)
+        with self._lock: self._collectors.append(func)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines.append("# TYPE vconvert_jobs_total counter")
+            for (kind, status), n in sorted(self._jobs.items()): lines.append(f'vconvert_jobs_total{{kind="{kind}",status="{status}"}} {n}')
+            lines.append("# TYPE vconvert_job_seconds summary")
+            for kind, (total, n) in sorted(self._seconds.items()):
+                lines.append(f'vconvert_job_seconds_sum{{kind="{kind}"}} {total:.6f}')
+                lines.append(f'vconvert_job_seconds_count{{kind="{kind}"}} {n}')
+            for metric, i in (("vconvert_stage_seconds_total", 0), ("vconvert_stage_cpu_seconds_total", 1), ("vconvert_stage_frames_total", 2)):
+                lines.append(f"# TYPE {metric} counter")
+                for (kind, stage), acc in sorted(self._stages.items()):
+                    value = f"{acc[i]:.6f}" if i < 2 else str(acc[i])
+                    lines.append(f'{metric}{{kind="{kind}",stage="{stage}"}} {value}')
+            collectors = list(self._collectors)
+        for func in collectors:
+            for name, labels, value in func():
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def enable_json_log(path=None):
+    # ジョブごとの JSON ログを path (省略時は標準エラー) に1行ずつ出す。何度呼んでもハンドラは1つ
+    if getattr(logger, "_vconvert_handler", None) is not None: return logger
+    handler = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger._vconvert_handler = handler
+    return logger
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    # http://host:port/metrics で集計を返すサーバーを1つだけ起動する
+    global _server
+    with _server_lock:
+        if _server is None:
+            try: _server = ThreadingHTTPServer((host, int(port)), _Handler)
+            except OSError as e: # 別のプロセスが使用中など。変換には影響させない
+                logger.warning(json.dumps({"event": "metrics_server_failed", "port": int(port), "error": str(e)}))
+                return None
+            threading.Thread(target=_server.serve_forever, name="vconvert-metrics", daemon=True).start()
+        return _server
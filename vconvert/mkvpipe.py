@@ -0,0 +1,63 @@
+import struct
+
+import numpy as np
+
+# --- 可変フレーム長のフレームを ffmpeg へ渡すための最小限の Matroska ライタ ---
+# rawvideo パイプでは各フレームの表示時間を渡せないので、無圧縮 RGB24 (V_UNCOMPRESSED) の
+# Matroska ストリームとして書き出す。各フレームは時刻と表示時間付きの BlockGroup になる。
+# ffmpeg 側は "-f matroska -i pipe:0" で読み込む。
+
+TIMESTAMP_SCALE = 1000000  # 1 tick = 1 ms
+_UNKNOWN_SIZE = b"\x01\xff\xff\xff\xff\xff\xff\xff"
+
+
+def _size(n):
+    return struct.pack(">Q", n | (1 << 56))  # 8バイト固定長の可変長整数
+
+
+def _uint(n):
+    n = int(n)
+    length = max(1, (n.bit_length() + 7) // 8)
+    return n.to_bytes(length, "big")
+
+
+def _el(eid, payload):
+    return eid + _size(len(payload)) + payload
+
+
+class MkvFrameWriter:
+    def __init__(self, stream, size):
+        self.stream = stream
+        self.w, self.h = int(size[0]), int(size[1])
+        self.pts_ms = 0.0
+        ebml = _el(b"\x1a\x45\xdf\xa3",
+                   _el(b"\x42\x86", _uint(1)) + _el(b"\x42\xf7", _uint(1)) +
+                   _el(b"\x42\xf2", _uint(4)) + _el(b"\x42\xf3", _uint(8)) +
+                   _el(b"\x42\x82", b"matroska") + _el(b"\x42\x87", _uint(4)) + _el(b"\x42\x85", _uint(2)))
+        info = _el(b"\x15\x49\xa9\x66",
+                   _el(b"\x2a\xd7\xb1", _uint(TIMESTAMP_SCALE)) +
+                   _el(b"\x4d\x80", b"vconvert") + _el(b"\x57\x41", b"vconvert"))
+        video = _el(b"\xe0",
+                    _el(b"\xb0", _uint(self.w)) + _el(b"\xba", _uint(self.h)) +
+                    _el(b"\x2e\xb5\x24", b"RGB\x18"))  # ColourSpace: RGB24 の FourCC
+        track = _el(b"\xae",
+                    _el(b"\xd7", _uint(1)) + _el(b"\x73\xc5", _uint(1)) + _el(b"\x83", _uint(1)) +
+                    _el(b"\x86", b"V_UNCOMPRESSED") + video)
+        tracks = _el(b"\x16\x54\xae\x6b", track)
+        stream.write(ebml + b"\x18\x53\x80\x67" + _UNKNOWN_SIZE + info + tracks)
+
+    def write(self, frame, duration):
+        # frame: HxWx3 uint8、duration: 表示時間 (秒)
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        if frame.shape != (self.h, self.w, 3): raise ValueError(f"frame size {frame.shape[1]}x{frame.shape[0]} != {self.w}x{self.h}")
+        start = int(round(self.pts_ms))
+        self.pts_ms += duration * 1000.0
+        dur = max(1, int(round(self.pts_ms)) - start)
+        # クラスタごとに1フレーム (ブロックの相対時刻は 0)
+        block_head = b"\xa1" + _size(4 + frame.nbytes) + b"\x81\x00\x00\x00"
+        group = block_head + _el(b"\x9b", _uint(dur))
+        header = (b"\x1f\x43\xb6\x75" + _size(len(_el(b"\xe7", _uint(start))) + 1 + 8 + len(group) + frame.nbytes) +
+                  _el(b"\xe7", _uint(start)) + b"\xa0" + _size(len(group) + frame.nbytes))
+        self.stream.write(header + block_head)
+        self.stream.write(memoryview(frame).cast("B"))
+        self.stream.write(_el(b"\x9b", _uint(dur)))
@@ -0,0 +1,296 @@
+import hashlib
+import itertools
+import os
+from contextlib import ExitStack
+
+import numpy as np
+from PIL import Image
+
+from .decoder_pool import decoder_pool
+from .dedup import dedup_frames
+from .extract import iter_frames_at, probe_info
+from .frames import fit_frame, resize_frame
+from .gif import write_gif
+from .metrics import Metrics
+from .render import iter_rendered_frames, make_stream_clip, output_size, output_times
+from .result_cache import file_digest, make_key
+from .target_size import SAFETY, apply_choice, choose, sample_model
+from .scenes import iter_analysis_frames, iter_keyframes, keyframe_times, scene_frame_times, scene_scores, select_scenes, thin_times
+from .watermark import apply_watermarks
+from .webp import webp_options, write_webp
+from .zipstream import ZipImageWriter
+
+# --- 変換処理本体 ---
+# Streamlit に依存しない アニメーション変換 / 静止画抽出 の処理。
+# 設定は dict で受け取り、進捗は progress(パーセント, ステータスのキー) で通知する (キーは画面の文言辞書のもの)。
+
+GIF_ENCODERS = ["ffmpeg (palette)", "moviepy"]
+
+ANIMATION_DEFAULTS = {
+    "start": 0.0, "end": None, "format": "GIF", "width": 300, "fps": 10, "workers": 1,
+    "gif_encoder": GIF_ENCODERS[0], "gif_dither": "sierra2_4a", "gif_colors": 256, "gif_stats": "full",
+    "dedup": False, "dedup_tol": 2, "wm_configs": [], "thumb": None,
+    "webp_preset": "balanced", "webp_quality": None,  # webp_quality を省略するとプリセットの値
+    "target_bytes": None,  # 指定すると幅・fps・色数/品質を上限として、このサイズに収まる設定を選ぶ
+}
+THUMB_SECONDS = 0.1  # 先頭に置くサムネイルの表示時間
+
+# mode: count (均等) / interval (一定間隔) / keyframes (キーフレームのみ) / scene (シーンの切り替わり)
+EXTRACTION_DEFAULTS = {
+    "mode": "count", "count": 10, "interval": 1.0, "width": 1920, "format": "JPEG", "quality": 85,
+    "interpolation": "auto", "wm_configs": [], "min_interval": 0.5, "max_frames": 100, "scene_threshold": 0.08,
+}
+
+
+def _noop(percent, key=None):
+    pass
+
+
+def _thumb_image(thumb):
+    if thumb is None: return None
+    if isinstance(thumb, str): thumb = Image.open(thumb)
+    if isinstance(thumb, np.ndarray): thumb = Image.fromarray(thumb)
+    return thumb.convert("RGB")
+
+
+# --- キャッシュキー用の設定の正規化 ---
+# 出力に影響する項目だけを JSON にできる形で残す
+# (workers は 1 か 2 以上かだけを含める。並列の描画は fps が整数でない動画で moviepy と選ぶフレームがずれることがある)
+
+def _num(x):
+    return None if x is None else round(float(x), 3)
+
+
+def _wm_key(wm_configs):
+    keys = []
+    for cfg in wm_configs:
+        cfg = dict(cfg)
+        if cfg.get("font"): cfg["font"] = file_digest(cfg["font"])
+        keys.append(cfg)
+    return keys
+
+
+def _thumb_key(thumb):
+    img = _thumb_image(thumb)
+    if img is None: return None
+    arr = np.asarray(img)
+    return [arr.shape, hashlib.sha256(arr.tobytes()).hexdigest()]
+
+
+def animation_cache_key(video_path, settings):
+    s = {**ANIMATION_DEFAULTS, **settings}
+    norm = {"start": _num(s["start"]), "end": _num(s["end"]), "format": s["format"], "width": int(s["width"]), "fps": _num(s["fps"]),
+            "wm": _wm_key(s["wm_configs"]), "thumb": _thumb_key(s["thumb"]), "parallel": int(s["workers"]) > 1}
+    if s["format"] == "GIF":
+        norm.update(gif_encoder=s["gif_encoder"], gif_dither=s["gif_dither"], gif_colors=int(s["gif_colors"]), gif_stats=s["gif_stats"])
+    else: norm["webp"] = webp_options(s["webp_preset"], s["webp_quality"])
+    if s["dedup"]: norm["dedup_tol"] = int(s["dedup_tol"])
+    if s["target_bytes"]: norm["target_bytes"] = int(s["target_bytes"])
+    return make_key("anim", file_digest(video_path), norm)
+
+
+def extraction_cache_key(video_path, settings):
+    s = {**EXTRACTION_DEFAULTS, **settings}
+    norm = {"mode": s["mode"], "width": int(s["width"]), "format": s["format"], "interpolation": s["interpolation"],
+            "wm": _wm_key(s["wm_configs"])}
+    if s["mode"] == "count": norm["count"] = int(s["count"])
+    elif s["mode"] == "interval": norm["interval"] = _num(s["interval"])
+    else: norm.update(min_interval=_num(s["min_interval"]), max_frames=int(s["max_frames"]))
+    if s["mode"] == "scene": norm["scene_threshold"] = _num(s["scene_threshold"])
+    if s["format"] == "JPEG": norm["quality"] = int(s["quality"])
+    return make_key("image", file_digest(video_path), norm)
+
+
+def _cached(cache, key, out_path, progress):
+    # キャッシュにあれば out_path に置いて True。なければ out_path を空けておく (前回の結果が残らないように)
+    if cache.fetch(key, out_path):
+        progress(100, "finish")
+        return True
+    if os.path.exists(out_path): os.remove(out_path)
+    return False
+
+
+def _resize_frames(frames, size, wm_configs, metrics):
+    # リサイズと透かし (ndarray のまま)。リサイズで新しい配列になった場合は透かしをその配列に直接描く
+    for frame in frames:
+        with metrics.stage("resize"): out = resize_frame(frame, size)
+        metrics.add_frames("resize")
+        if wm_configs:
+            with metrics.stage("watermark"): out = apply_watermarks(out, wm_configs, inplace=out is not frame)
+            metrics.add_frames("watermark")
+        yield out
+
+
+def _watermark_timed(timed, wm_configs, metrics):
+    for frame, duration in timed:
+        with metrics.stage("watermark"): frame = apply_watermarks(frame, wm_configs)
+        metrics.add_frames("watermark")
+        yield frame, duration
+
+
+def convert_animation(video_path, out_path, settings, progress=None, clip=None, cache=None, metrics=None):
+    # clip を省略すると、1プロセスで変換する場合だけデコーダプールから専用の読み込みプロセスを借りる
+    # (並列時や目標サイズの試しのエンコードは ffmpeg を直接使うので、メタデータだけをプローブする)
+    # cache (ResultCache) を渡すと同じ入力・設定の結果を再利用し、新しい結果を保存する
+    # metrics (Metrics) を渡すと工程ごとの時間を記録する。進捗は変換したフレーム数で通知する
+    s = {**ANIMATION_DEFAULTS, **settings}
+    progress = progress or _noop
+    metrics = metrics or Metrics()
+    if cache is not None:
+        with metrics.stage("cache"):
+            key = animation_cache_key(video_path, settings)
+            hit = _cached(cache, key, out_path, progress)
+        if hit: return out_path
+        convert_animation(video_path, out_path, settings, progress, clip, metrics=metrics)
+        with metrics.stage("cache"): cache.store(key, out_path)
+        return out_path
+    if s["target_bytes"]: return _convert_to_target(video_path, out_path, s, progress, clip, metrics)
+    if clip is None and s["workers"] <= 1:
+        with ExitStack() as stack:
+            with metrics.stage("open"): leased = stack.enter_context(decoder_pool.lease(video_path))
+            return convert_animation(video_path, out_path, settings, progress, leased, metrics=metrics)
+    if clip is None:
+        with metrics.stage("open"): clip = probe_info(video_path)
+
+    start_t = s["start"]
+    end_t = clip.duration if s["end"] is None else s["end"]
+    fps, resize_width, workers, wm_configs = s["fps"], s["width"], s["workers"], s["wm_configs"]
+    out_fmt, gif_encoder = s["format"], s["gif_encoder"]
+    gif_options = {"dither": s["gif_dither"], "max_colors": s["gif_colors"], "stats_mode": s["gif_stats"]}
+    webp_opts = webp_options(s["webp_preset"], s["webp_quality"])
+    thumb = _thumb_image(s["thumb"])
+    out_size = output_size(clip.size, resize_width)
+    # 重複除去は可変フレーム長を書ける ffmpeg のエンコーダでのみ行う
+    use_dedup = s["dedup"] and (out_fmt == "WebP" or gif_encoder == GIF_ENCODERS[0])
+
+    # 読み込んだフレーム数で進捗を進める (エンコーダが要求した分だけ読み込まれる)
+    metrics.start(len(output_times(start_t, end_t, fps)), progress, "status_export_anim")
+    if workers > 1:
+        # 区間ごとにプロセスプールで デコード・リサイズ・透かし を行い、順番に受け取る
+        frames = metrics.count(metrics.iter_stage("render", iter_rendered_frames(video_path, start_t, end_t, fps, clip.fps, clip.size, resize_width, wm_configs, workers=workers)))
+    else:
+        frames = metrics.count(metrics.iter_stage("decode", clip.subclip(start_t, end_t).iter_frames(fps=fps, dtype="uint8")))
+        # 重複除去する場合は透かしを除去後に入れる (残ったフレームにだけ描けばよい)
+        frames = _resize_frames(frames, out_size, None if use_dedup else wm_configs, metrics)
+
+    # サムネイルは出力サイズに合わせた表示時間つきの1フレームとして先頭に置くだけで、各フレームに合成しない
+    thumb_item = None
+    if thumb is not None:
+        with metrics.stage("thumbnail"): thumb_item = (fit_frame(np.array(thumb), out_size), THUMB_SECONDS)
+
+    if use_dedup:
+        timed = metrics.iter_stage("dedup", dedup_frames(frames, fps, s["dedup_tol"]))
+        if wm_configs and workers == 1: timed = _watermark_timed(timed, wm_configs, metrics)
+        if thumb_item is not None: timed = itertools.chain([thumb_item], timed)
+        with metrics.stage("encode"):
+            if out_fmt == "WebP": write_webp(timed, out_path, fps, out_size, timed=True, **webp_opts)
+            else: write_gif(timed, out_path, fps, out_size, timed=True, **gif_options)
+        progress(100, "finish")
+        return out_path
+
+    if out_fmt == "WebP" or gif_encoder == GIF_ENCODERS[0]:
+        # フレームを直接エンコーダへ渡す
+        if thumb_item is not None: frames = itertools.chain([thumb_item], ((frame, 1.0 / fps) for frame in frames))
+        with metrics.stage("encode"):
+            if out_fmt == "WebP": write_webp(frames, out_path, fps, out_size, timed=thumb_item is not None, **webp_opts)
+            else:
+                try: write_gif(frames, out_path, fps, out_size, timed=thumb_item is not None, **gif_options)
+                except OSError: # ffmpeg を起動できない場合は従来の方法
+                    if thumb_item is not None: raise
+                    make_stream_clip(frames, fps, end_t - start_t, out_size).write_gif(out_path, fps=fps, logger=None)
+        progress(100, "finish")
+        return out_path
+
+    # moviepy の GIF エンコーダはフレーム列をクリップとして渡す (サムネイルは同じ大きさのクリップを先頭に繋ぐ)
+    processed = make_stream_clip(frames, fps, end_t - start_t, out_size)
+    if thumb_item is not None:
+        from moviepy.editor import ImageClip, concatenate_videoclips
+        processed = concatenate_videoclips([ImageClip(thumb_item[0]).set_duration(THUMB_SECONDS).set_fps(fps), processed])
+    with metrics.stage("encode"): processed.write_gif(out_path, fps=fps, logger=None)
+    progress(100, "finish")
+    return out_path
+
+
+def _convert_to_target(video_path, out_path, s, progress, clip, metrics):
+    # 目標サイズ: 短い区間の試しのエンコードから設定を選び、本番は1回。超えたら予測とのずれの分だけ補正して1回だけやり直す
+    target = int(s["target_bytes"])
+    # 試しのエンコードはメタデータだけで足りる。本番の変換は clip がなければそれぞれ必要な分だけ借りる
+    info = clip if clip is not None else probe_info(video_path)
+    end_t = info.duration if s["end"] is None else s["end"]
+    duration = end_t - s["start"]
+    progress(0, "status_sampling")
+    model = sample_model(video_path, info, s, metrics)
+    choice, predicted = choose(model, s, duration, target * SAFETY)
+    convert_animation(video_path, out_path, apply_choice(s, choice), progress, clip, metrics=metrics)
+    actual = os.path.getsize(out_path)
+    if actual > target:
+        retry, _ = choose(model, s, duration, target * SAFETY * predicted / actual)
+        if retry != choice:
+            progress(0, "status_retry_size")
+            convert_animation(video_path, out_path, apply_choice(s, retry), progress, clip, metrics=metrics)
+    return out_path
+
+
+def extraction_times(duration, mode="count", count=10, interval=1.0):
+    # 抽出する時間のリスト
+    if mode == "count": return np.linspace(0, duration - 0.1, int(count))
+    return np.arange(0, duration - 0.1, interval)
+
+
+def extract_images(video_path, out_path, settings, progress=None, clip=None, cache=None, metrics=None):
+    # 抽出した画像を out_path の ZIP に書き出す
+    s = {**EXTRACTION_DEFAULTS, **settings}
+    progress = progress or _noop
+    metrics = metrics or Metrics()
+    if cache is not None:
+        with metrics.stage("cache"):
+            key = extraction_cache_key(video_path, settings)
+            hit = _cached(cache, key, out_path, progress)
+        if hit: return out_path
+        extract_images(video_path, out_path, settings, progress, clip, metrics=metrics)
+        with metrics.stage("cache"): cache.store(key, out_path)
+        return out_path
+    # フレームは ffmpeg から直接読むので、読み込みプロセスは借りずにメタデータだけをプローブする
+    if clip is None:
+        with metrics.stage("open"): clip = probe_info(video_path)
+
+    mode, keyframes = s["mode"], None
+    if mode == "keyframes":
+        # キーフレームの時刻はパケット情報から調べる (デコードしない)
+        with metrics.stage("analyze"): all_keys = keyframe_times(video_path)
+        keyframes = thin_times(all_keys, float(s["min_interval"]), int(s["max_frames"]))
+        times = all_keys[keyframes]
+    elif mode == "scene":
+        # 縮小グレースケールで全フレームの変化量を計算し、切り替わりのフレームを選ぶ
+        metrics.start(int(clip.duration * clip.fps), progress, "status_analyzing")
+        scores = scene_scores(metrics.count(metrics.iter_stage("analyze", iter_analysis_frames(video_path, clip.size, clip.fps))))
+        with metrics.stage("analyze"):
+            picked = select_scenes(scores, clip.fps, float(s["scene_threshold"]), float(s["min_interval"]), int(s["max_frames"]))
+        times = scene_frame_times(picked, clip.fps, int(clip.duration * clip.fps))
+    else: times = extraction_times(clip.duration, mode, s["count"], s["interval"])
+    if len(times) == 0: raise ValueError("no frames to extract")
+    wm_configs = s["wm_configs"]
+    metrics.start(len(times), progress, "status_extracting")
+
+    # ジョブ専用の ZIP (中間ファイルなし)
+    with ZipImageWriter(s["format"], s["quality"], path=out_path) as zip_writer:
+        ext = zip_writer.ext
+        # 1回の前方デコードで全フレームを取得し、デコード時にリサイズ (decode にリサイズも含まれる)。読み込みバッファは使い回す
+        target_h = int(s["width"] * clip.h / clip.w)
+        if keyframes is not None:
+            frames = iter_keyframes(video_path, keyframes, size=(s["width"], target_h), src_size=clip.size,
+                                    interpolation=s["interpolation"], buffers=zip_writer.max_pending + 2)
+        else:
+            frames = iter_frames_at(video_path, times, size=(s["width"], target_h), src_fps=clip.fps,
+                                    interpolation=s["interpolation"], src_size=clip.size, buffers=zip_writer.max_pending + 2)
+        for i, frame in enumerate(metrics.count(metrics.iter_stage("decode", frames))):
+            if wm_configs:
+                with metrics.stage("watermark"): frame = apply_watermarks(frame, wm_configs)
+                metrics.add_frames("watermark")
+            # エンコードはスレッドプールで行い、順番どおり ZIP に書き込む (待ち時間は zip に数える)
+            with metrics.stage("zip"): zip_writer.add(frame, f"image_{i+1:03d}.{ext}")
+            metrics.add_frames("zip")
+        progress(metrics.percent(), "status_zipping")
+        with metrics.stage("zip"): zip_writer.finish()
+    progress(100, "finish")
+    return out_path
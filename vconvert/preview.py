@@ -0,0 +1,139 @@
+import io
+import os
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from .decoder_pool import frame_cache
+from .extract import iter_frames_at
+from .ffmpeg import ffmpeg_exe, popen_kwargs
+from .render import output_size
+from .result_cache import file_digest
+from .upload_store import UploadStore
+from .watermark import apply_watermarks
+
+# --- プレビュー ---
+# アップロードごとに縮小した軽い動画 (プロキシ) を一度だけバックグラウンドで作り、画面の動画表示と設定中のプレビューに使う。
+# プロキシはキーフレーム間隔を短くしてあるので、任意の時刻へのシークがほぼデコードなしで終わる (4K でもすぐ返る)。
+# できあがるまでは元の動画を使う。変換結果は常に元の動画から作る。
+# プレビューは出力サイズで透かしを合成した1フレームと、開始位置からの短い低 fps ループ
+# (st.image がアニメーションのまま表示できるのは GIF だけなので GIF にする)。
+
+PROXY_LONG_SIDE = 640
+PROXY_GOP = 10        # キーフレーム間隔 (フレーム)
+PROXY_CRF = 28
+PROXY_QUOTA = 2 * 1024 ** 3
+STRIP_SECONDS = 3.0
+STRIP_FPS = 4
+STRIP_MAX_WIDTH = 320
+
+
+def proxy_size(src_size, long_side=PROXY_LONG_SIDE):
+    # 長辺を long_side 以下にした偶数サイズ (元が小さければそのまま)
+    w, h = src_size
+    scale = min(1.0, long_side / max(w, h))
+    return max(2, int(w * scale) // 2 * 2), max(2, int(h * scale) // 2 * 2)
+
+
+class ProxyStore(UploadStore):
+    def __init__(self, root=None, quota_bytes=PROXY_QUOTA):
+        super().__init__(root or os.path.join(tempfile.gettempdir(), "vconvert_proxies"), quota_bytes=quota_bytes)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vconvert-proxy")
+        self._pending = {}  # キー -> Future
+        self.failed = {}    # キー -> エラーメッセージ (同じ動画で何度も失敗しないよう再試行しない)
+
+    def _path(self, key):
+        return os.path.join(self.root, key + ".mp4")
+
+    def request(self, src, src_size, key=None):
+        # できていればプロキシのパス、まだなら作成を予約して None を返す (待たない)
+        # key は動画内容のハッシュ (アップロード保存領域のファイル名がそのままハッシュなので、呼び出し側で渡せば計算を省ける)
+        key = key or file_digest(src)
+        path = self._path(key)
+        with self._lock:
+            if os.path.exists(path):
+                self.touch(path)
+                return path
+            if key not in self._pending and key not in self.failed:
+                self._pending[key] = self._executor.submit(self._build, key, src, src_size, path)
+        return None
+
+    def wait(self, key, timeout=None):
+        # 作成中ならできあがるか timeout 秒たつまで待つ
+        with self._lock: future = self._pending.get(key)
+        if future is not None:
+            try: future.result(timeout)
+            except Exception: pass
+
+    def _build(self, key, src, src_size, path):
+        w, h = proxy_size(src_size)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        os.close(fd)
+        cmd = [ffmpeg_exe(), "-nostdin", "-v", "error", "-i", src, "-map", "0:v:0", "-an", "-sn",
+               "-vf", f"scale={w}:{h}:flags=bilinear", "-c:v", "libx264", "-preset", "ultrafast", "-tune", "fastdecode",
+               "-crf", str(PROXY_CRF), "-g", str(PROXY_GOP), "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+               "-f", "mp4", "-y", tmp_path]
+        try:
+            proc = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True, **popen_kwargs())
+            if proc.returncode != 0: raise RuntimeError(f"proxy encoding failed: {proc.stderr.decode(errors='replace').strip()}")
+            with self._lock:
+                os.replace(tmp_path, path)
+                self.touch(path)
+                self._evict(keep=path)
+        except Exception as e:
+            with self._lock: self.failed[key] = str(e)
+        finally:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            with self._lock: self._pending.pop(key, None)
+
+
+_proxy_store = None
+_proxy_lock = threading.Lock()
+
+
+def get_proxy_store():
+    global _proxy_store
+    with _proxy_lock:
+        if _proxy_store is None: _proxy_store = ProxyStore()
+        return _proxy_store
+
+
+def _frames_at(path, times, size, src_size, src_fps):
+    # 出力サイズに縮小したフレーム (frame_cache に入れるので、透かしを変えただけならデコードしない)
+    keys = [frame_cache.key(path, t, size) for t in times]
+    frames = [frame_cache.get(k) for k in keys]
+    missing = [i for i, f in enumerate(frames) if f is None]
+    if missing:
+        # 足りない分だけ1回のシーク + 前方デコードで取り出す (プロキシはキーフレームが密なのでシークが速い)
+        decoded = iter_frames_at(path, [times[i] for i in missing], size=size, src_fps=src_fps, interpolation="linear",
+                                 seek=True, src_size=src_size)
+        for i, frame in zip(missing, decoded): frames[i] = frame_cache.put(keys[i], frame)
+    return frames
+
+
+def preview_frame(path, t, src_size, src_fps, width, wm_configs):
+    # 時刻 t のフレームを出力幅にして透かしを合成する (出力と同じく縮小してから透かしを描く)
+    size = output_size(src_size, width)
+    frame, = _frames_at(path, [t], size, src_size, src_fps)
+    return apply_watermarks(frame, wm_configs)
+
+
+def preview_strip(path, start, end, src_size, src_fps, width, wm_configs, seconds=STRIP_SECONDS, fps=STRIP_FPS):
+    # start から最長 seconds 秒を fps 枚/秒で取り出したループする GIF (bytes)
+    # 透かしは出力サイズで描いてから縮小するので、大きさの見え方は出力と同じ
+    times = start + np.arange(0, max(min(seconds, end - start), 1e-6), 1.0 / fps)
+    size = output_size(src_size, width)
+    strip_w = min(size[0], STRIP_MAX_WIDTH)
+    strip_size = (strip_w, max(1, int(size[1] * strip_w / size[0])))
+    images = []
+    for frame in _frames_at(path, list(times), size, src_size, src_fps):
+        img = Image.fromarray(apply_watermarks(frame, wm_configs))
+        if img.size != strip_size: img = img.resize(strip_size, Image.BILINEAR)
+        images.append(img.quantize(method=Image.Quantize.FASTOCTREE))  # プレビューなので速い減色で十分
+    buf = io.BytesIO()
+    images[0].save(buf, "GIF", save_all=True, append_images=images[1:], duration=int(1000 / fps), loop=0)
+    return buf.getvalue()
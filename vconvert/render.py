@@ -0,0 +1,128 @@
+import math
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from .extract import iter_frames_at
+from .frames import resize_frame
+from .watermark import apply_watermarks
+
+# --- 並列セグメント描画 (アニメーション変換) ---
+# トリミング範囲を時間区間に分け、プロセスプールで デコード → リサイズ → 透かし を並列に行う。
+# 完成したフレームは元の順番でエンコーダへ流す。未消費のフレームのバイト数には上限があり、動画が長くても出力幅が大きくてもメモリは増えない。
+# リサイズは moviepy の resize と同じ。フレームの選び方は extract.iter_frames_at (時刻 t はフレーム int(fps * t)) なので、
+# fps が整数でない動画では moviepy の iter_frames と1フレームずれることがある (結果は workers > 1 のどの値でも同じ)。
+
+DEFAULT_MAX_INFLIGHT_BYTES = 256 * 1024 ** 2  # 1ジョブあたり (受け取り時の一時的なコピーは含まない)
+
+
+def output_size(src_size, width):
+    # moviepy の resize(width=...) と同じ計算
+    w, h = src_size
+    return int(width), int(h * width / w)
+
+
+def output_times(start, end, fps):
+    # moviepy の iter_frames と同じ時刻列 (subclip 先頭からの相対時刻 + 開始位置)
+    return start + np.arange(0, end - start, 1.0 / fps)
+
+
+def render_segment(path, times, src_fps, size, wm_configs, threads=1):
+    # ワーカープロセスで実行される。区間のフレームを (枚数, 高さ, 幅, 3) の配列で返す
+    # デコードしたフレームは1枚のバッファを使い回し、リサイズ結果は返却用の配列へ直接書き込む
+    out = np.empty((len(times), size[1], size[0], 3), dtype=np.uint8)
+    n = 0
+    for i, frame in enumerate(iter_frames_at(path, times, src_fps=src_fps, threads=threads, seek=True, buffers=1)):
+        resize_frame(frame, size, out=out[i])
+        if wm_configs: apply_watermarks(out[i], wm_configs, inplace=True)
+        n = i + 1
+    return out[:n]
+
+
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+
+def get_process_pool(workers):
+    # Streamlit サーバーはスレッドを持つので fork ではなく spawn で起動する。
+    # プールは CPU 数の大きさで1つだけ作って使い回す (spawn のプールはプロセスを必要になった分だけ起動する)。
+    # 同時に使うプロセス数は呼び出し側で workers 以下に抑える。それより大きい workers が来たときだけ作り直す
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or _pool_size < workers:
+            # 古いプールは shutdown しない (使用中のジョブが submit できなくなる)。参照がなくなればプロセスも終了する
+            _pool_size = max(workers, os.cpu_count() or 1)
+            _pool = ProcessPoolExecutor(max_workers=_pool_size, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _drop_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool: _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def default_workers():
+    return max(1, min(8, os.cpu_count() or 1))
+
+
+def iter_rendered_frames(path, start, end, fps, src_fps, src_size, width, wm_configs,
+                         workers=None, max_inflight_bytes=DEFAULT_MAX_INFLIGHT_BYTES):
+    # 完成フレームを順番に返すジェネレータ
+    workers = workers or default_workers()
+    size = output_size(src_size, width)
+    times = output_times(start, end, fps)
+    if len(times) == 0: return
+    # 未消費のフレームを max_inflight_bytes に収める (出力幅 2000 px なら 40 枚弱)
+    max_frames = max(1, max_inflight_bytes // (size[0] * size[1] * 3))
+    seg_frames = max(1, min(math.ceil(len(times) / workers), max_frames // workers))
+    segments = [times[i:i + seg_frames] for i in range(0, len(times), seg_frames)]
+    # 共有のプールでもこのジョブが同時に使うのは workers プロセスまで
+    max_pending = max(1, min(workers, max_frames // seg_frames))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    pool = get_process_pool(workers)
+    pending = deque()
+    it = iter(segments)
+    try:
+        for seg in it:
+            pending.append(pool.submit(render_segment, path, seg, src_fps, size, wm_configs, threads))
+            if len(pending) >= max_pending: break
+        while pending:
+            frames = pending.popleft().result()
+            nxt = next(it, None)
+            if nxt is not None:
+                pending.append(pool.submit(render_segment, path, nxt, src_fps, size, wm_configs, threads))
+            for frame in frames: yield frame
+    except BrokenProcessPool:
+        _drop_pool(pool)
+        raise
+    finally:
+        for fut in pending: fut.cancel()
+
+
+def make_stream_clip(frames, fps, duration, size):
+    # フレームのイテレータを moviepy のクリップとして扱うための薄いラッパー。
+    # エンコーダは時刻順に get_frame を呼ぶので、要求された時刻まで読み進める
+    from moviepy.editor import VideoClip
+    it = iter(frames)
+    state = {"k": -1, "frame": None}
+
+    def make_frame(t):
+        k = int(t * fps + 1e-6)
+        while state["k"] < k:
+            frame = next(it, None)
+            if frame is None: break
+            state["k"] += 1
+            state["frame"] = frame
+        if state["frame"] is None: return np.zeros((size[1], size[0], 3), dtype=np.uint8)
+        return state["frame"]
+
+    return VideoClip(make_frame, duration=duration).set_fps(fps)
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from .metrics import registry
+from .upload_store import UploadStore
+
+# --- 変換結果キャッシュ ---
+# 入力動画の内容ハッシュと正規化した設定からキーを作り、完成したファイルをディスクに保存する。
+# 同じ条件の変換は保存済みのファイルを返すだけで終わる。容量上限を超えたら最終利用が古いものから削除する (LRU)。
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+KEY_VERSION = 4  # 出力が変わる修正をしたら上げる (古い結果を使わないため)
+
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def file_digest(path, chunk_size=8 * 1024 * 1024):
+    # ファイル内容の sha256。(パス, サイズ, 更新時刻) が同じ間は計算結果を使い回す
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _digests_lock:
+        digest = _digests.get(memo_key)
+    if digest is not None: return digest
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk: break
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _digests_lock:
+        if len(_digests) > 1024: _digests.clear()
+        _digests[memo_key] = digest
+    return digest
+
+
+def make_key(*parts):
+    # parts は JSON にできる値 (設定は呼び出し側で正規化しておく)
+    blob = json.dumps([KEY_VERSION, *parts], sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _copy_replace(src, dst):
+    # 同じディレクトリの一時ファイルへコピーしてから置き換える (途中のファイルが見えない)
+    # ハードリンクは使わない: 出力先へあとで上書きで書き込まれると、保存済みの結果まで書き換わるため
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(dst)), suffix=".part")
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
+
+
+class ResultCache(UploadStore):
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__(root or os.path.join(tempfile.gettempdir(), "vconvert_results"), quota_bytes=max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key, dest):
+        return os.path.join(self.root, key + os.path.splitext(dest)[1].lower())
+
+    def fetch(self, key, dest):
+        # 保存済みなら dest に置いて True を返す
+        path = self._path(key, dest)
+        with self._lock:
+            if not os.path.exists(path):
+                self.misses += 1
+                return False
+            self.touch(path)
+            self.hits += 1
+        try: _copy_replace(path, dest)
+        except FileNotFoundError: # 直前に削除された場合
+            with self._lock: self.hits -= 1; self.misses += 1
+            return False
+        return True
+
+    def store(self, key, src):
+        # 完成したファイルのコピーを保存する (src はこのあと呼び出し側で書き換えられてもよい)
+        path = self._path(key, src)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        os.close(fd)
+        try:
+            shutil.copyfile(src, tmp_path)
+            with self._lock:
+                os.replace(tmp_path, path)
+                self.touch(path)
+                self._evict(keep=path)
+        except BaseException:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            raise
+        return path
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "bytes": self.usage()}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+            registry.add_collector(lambda: [(f"vconvert_result_cache_{k}", {}, v) for k, v in _cache.stats().items()])
+        return _cache
@@ -0,0 +1,154 @@
+import bisect
+import re
+import subprocess
+import tempfile
+
+import numpy as np
+
+from .ffmpeg import ffmpeg_exe, popen_kwargs, read_exact, readinto_exact, stop_process
+from .frames import FrameRing, ffmpeg_scale_flags
+
+# --- キーフレーム / シーンチェンジ抽出 ---
+# キーフレーム: キーフレームの時刻はデコードせずにパケット情報 (-discard nokey -c copy) から調べ、
+#   画像は -skip_frame nokey でキーフレームだけをデコードして取り出す。間のフレームは一切デコードしない。
+# シーンチェンジ: 縮小したグレースケールでデコードし、連続フレームの平均差分をまとめて NumPy で計算する。
+#   解析ではループフィルタと B フレームのデコードを省き (約3倍速)、抜けたフレームは直前のフレームで埋めて番号を揃える。
+#   選んだ時刻だけを iter_frames_at でフル解像度から取り出す。
+
+ANALYSIS_WIDTH = 64
+SCORE_CHUNK = 256
+DEFAULT_SCENE_THRESHOLD = 0.08  # 平均差分 (0-1)。これ以上変化したフレームをシーンの切り替わりとみなす
+MAX_SELECTED = 1000             # 選ぶフレーム数の上限 (iter_frames_at の select 式の上限と同じ)
+# B フレームを飛ばした解析では切り替わりの位置が1-2フレーム前後するので、取り出すのはその少し後のフレームにする
+SCENE_SETTLE_FRAMES = 2
+
+
+def _run_text(cmd):
+    proc = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True, **popen_kwargs())
+    if proc.returncode != 0: raise RuntimeError(f"ffmpeg failed: {proc.stderr.decode(errors='replace').strip()}")
+    return proc.stdout.decode(errors="replace")
+
+
+def keyframe_times(path):
+    # キーフレームの表示時刻 (秒、昇順)。パケットをコピーするだけなのでデコードしない
+    out = _run_text([ffmpeg_exe(), "-nostdin", "-v", "error", "-discard", "nokey", "-i", path,
+                     "-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-"])
+    tb = re.search(r"^#tb 0: (\d+)/(\d+)", out, re.M)
+    if tb is None: raise RuntimeError("no video stream")
+    num, den = int(tb.group(1)), int(tb.group(2))
+    pts = [int(line.split(",")[2]) for line in out.splitlines() if line and not line.startswith("#")]
+    return np.sort(np.array(pts, dtype=float) * num / den)
+
+
+def thin_times(times, min_interval=0.0, max_frames=None):
+    # 前に選んだ時刻から min_interval 秒以上離れたものを残し、max_frames を超えたら等間隔に間引く
+    # 戻り値は times の中の添字
+    keep, last = [], None
+    for i, t in enumerate(times):
+        if last is None or t - last >= min_interval:
+            keep.append(i)
+            last = t
+    if max_frames and len(keep) > max_frames:
+        pick = np.unique(np.linspace(0, len(keep) - 1, int(max_frames)).round().astype(int))
+        keep = [keep[i] for i in pick]
+    return keep
+
+
+def _iter_raw(cmd, w, h, channels, ring=None, what="ffmpeg decoding"):
+    frame_bytes = w * h * channels
+    shape = (h, w, channels) if channels > 1 else (h, w)
+    err = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=err,
+                            bufsize=frame_bytes, **popen_kwargs())
+    try:
+        n = 0
+        while True:
+            if ring is not None:
+                buf = ring.get()
+                if not readinto_exact(proc.stdout, buf): break
+                frame = buf
+            else:
+                buf = read_exact(proc.stdout, frame_bytes)
+                if buf is None: break
+                frame = np.frombuffer(buf, dtype=np.uint8).reshape(shape)
+            n += 1
+            yield frame
+        if proc.wait() != 0 or n == 0:
+            err.seek(0)
+            raise RuntimeError(f"{what} failed: {err.read().decode(errors='replace').strip() or 'no frames'}")
+    finally:
+        stop_process(proc)
+        err.close()
+
+
+def iter_keyframes(path, indices=None, size=None, src_size=None, interpolation="lanczos", buffers=0):
+    # キーフレームだけをデコードして返す。indices は何番目のキーフレームを返すか (省略時はすべて)
+    from .extract import probe_size
+    if indices is not None and len(indices) == 0: return
+    src_size = src_size or probe_size(path)
+    w, h = (int(size[0]), int(size[1])) if size else src_size
+    filters = []
+    if indices is not None:
+        filters.append("select='" + "+".join(f"eq(n\\,{int(i)})" for i in sorted(set(indices))) + "'")
+    if size: filters.append(f"scale={w}:{h}:flags={ffmpeg_scale_flags(interpolation, src_size, size)}")
+    filters.append("format=rgb24")
+    cmd = [ffmpeg_exe(), "-nostdin", "-v", "error", "-skip_frame", "nokey", "-i", path, "-an", "-sn",
+           "-vf", ",".join(filters), "-fps_mode", "passthrough"]
+    if indices is not None: cmd += ["-frames:v", str(len(set(indices)))]
+    cmd += ["-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"]
+    ring = FrameRing((h, w, 3), buffers) if buffers > 0 else None
+    yield from _iter_raw(cmd, w, h, 3, ring, "keyframe extraction")
+
+
+def analysis_size(src_size, width=ANALYSIS_WIDTH):
+    w, h = src_size
+    return int(width), max(2, int(round(h * width / w)))
+
+
+def iter_analysis_frames(path, src_size, fps, width=ANALYSIS_WIDTH, fast=True):
+    # シーン判定用の縮小グレースケールフレーム (一定 fps で全フレーム分。縮小は面積平均)
+    w, h = analysis_size(src_size, width)
+    skip = ["-skip_loop_filter", "all", "-skip_frame", "bidir"] if fast else []
+    cmd = [ffmpeg_exe(), "-nostdin", "-v", "error", *skip, "-i", path, "-an", "-sn",
+           "-vf", f"scale={w}:{h}:flags=area,format=gray", "-fps_mode", "cfr", "-r", f"{fps}",
+           "-f", "rawvideo", "-pix_fmt", "gray", "pipe:1"]
+    yield from _iter_raw(cmd, w, h, 1, what="scene analysis")
+
+
+def scene_scores(frames, chunk=SCORE_CHUNK):
+    # 各フレームと直前のフレームの平均絶対差 (0-1)。先頭フレームは 1.0
+    scores, prev, block = [np.ones(1, dtype=np.float32)], None, []
+
+    def flush(block, prev):
+        arr = np.stack(block if prev is None else [prev, *block]).astype(np.int16)
+        d = np.abs(np.diff(arr, axis=0)).mean(axis=(1, 2), dtype=np.float32) / 255.0
+        scores.append(d)
+        return block[-1]
+
+    for frame in frames:
+        block.append(frame)
+        if len(block) >= chunk: prev, block = flush(block, prev), []
+    if block and (prev is not None or len(block) > 1): prev = flush(block, prev)
+    return np.concatenate(scores)
+
+
+def scene_frame_times(frame_indices, fps, n_frames):
+    # 選んだフレーム番号から取り出す時刻 (少し後ろへずらし、最後のフレームを超えない)
+    idx = np.minimum(np.asarray(frame_indices, dtype=int) + SCENE_SETTLE_FRAMES, max(0, n_frames - 1))
+    return np.unique(idx) / fps
+
+
+def select_scenes(scores, fps, threshold=DEFAULT_SCENE_THRESHOLD, min_interval=0.5, max_frames=None):
+    # 変化の大きい順に、既に選んだフレームから min_interval 秒以上離れたものを選ぶ。戻り値はフレーム番号 (昇順)
+    max_frames = min(int(max_frames or MAX_SELECTED), MAX_SELECTED)
+    candidates = np.flatnonzero(scores >= threshold)
+    candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+    gap = max(1, int(round(min_interval * fps)))
+    chosen = []  # 昇順に保つ (前後の選択済みフレームとだけ比べればよい)
+    for idx in candidates:
+        if len(chosen) >= max_frames: break
+        i = bisect.bisect_left(chosen, idx)
+        if i > 0 and idx - chosen[i - 1] < gap: continue
+        if i < len(chosen) and chosen[i] - idx < gap: continue
+        chosen.insert(i, int(idx))
+    return chosen
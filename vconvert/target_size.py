@@ -0,0 +1,166 @@
+import math
+import os
+import tempfile
+
+import numpy as np
+
+from .dedup import dedup_frames
+from .extract import iter_frames_at
+from .frames import resize_frame
+from .gif import write_gif
+from .render import output_size
+from .scenes import keyframe_times
+from .watermark import apply_watermarks
+from .webp import webp_options, write_webp
+
+# --- 目標ファイルサイズ ---
+# 切り出し範囲から短い区間をいくつか取り出し、幅・fps・色数 (GIF) / 品質 (WebP) を変えて数回だけ試しにエンコードする。
+# 結果から log(サイズ) = c0 + a*log(幅) + b*log(fps) + c*log(色数 or 品質) を最小二乗で求め、
+# 予測が目標に収まる中で一番見た目の良い組み合わせを選ぶ。本番のエンコードは1回で、超えた場合だけ補正して1回やり直す。
+# 画面で指定した幅・fps・色数・品質は上限として扱う (それより上げることはしない)。
+
+SAMPLE_SEGMENTS = 3
+SAMPLE_SECONDS = (0.5, 1.0)  # 1区間の長さ (範囲の 4% を最短・最長で制限する)
+SAMPLE_FRACTION = 0.04
+SAFETY = 0.92               # 予測の誤差を見込んで目標の 92% に収まる設定を選ぶ
+MIN_WIDTH = 64
+MIN_FPS = 2
+WIDTH_RATIOS = (1.0, 0.9, 0.8, 0.7, 0.6, 0.5, 0.42, 0.35, 0.3, 0.25, 0.2)
+FPS_RATIOS = (1.0, 0.8, 0.67, 0.5, 0.4, 0.33)
+GIF_COLORS = (256, 192, 128, 96, 64, 48, 32)
+WEBP_QUALITIES = (90, 80, 70, 60, 50, 40, 30)
+# 見た目の良さの重み (幅を落とすより fps や色数を落とす方を先に選ぶ)
+FPS_WEIGHT = 0.5
+QUALITY_WEIGHT = 0.3
+
+
+def _quality_key(s):
+    # 変えられる画質の項目 (moviepy の GIF エンコーダは色数を、可逆の WebP は画質を指定できないので変えない)
+    if s["format"] == "WebP": return None if webp_options(s["webp_preset"])["lossless"] else "webp_quality"
+    if s["gif_encoder"].startswith("ffmpeg"): return "gif_colors"
+    return None
+
+
+def _quality_limit(s, qkey):
+    if qkey == "webp_quality": return webp_options(s["webp_preset"], s["webp_quality"])["quality"]
+    return int(s[qkey])
+
+
+def _segments(start, end, keyframes=(), src_fps=30.0, n=SAMPLE_SEGMENTS):
+    # 範囲を n 等分した各区間の中央から短い区間を取る (範囲が短ければ全体を1区間)
+    # 近くにキーフレームがあればその直後から始める (シークしたあと前のキーフレームからデコードし直さずに済む)
+    duration = end - start
+    seconds = min(max(duration * SAMPLE_FRACTION, SAMPLE_SECONDS[0]), SAMPLE_SECONDS[1])
+    if duration <= n * seconds: return [(start, end)]
+    starts = []
+    for i in range(n):
+        a = start + duration * (i + 0.5) / n - seconds / 2
+        near = [k + 1.0 / src_fps for k in keyframes if abs(k - a) <= duration / (2 * n) and start <= k and k + 1.0 / src_fps + seconds <= end]
+        if near: a = min(near, key=lambda k: abs(k - a))
+        if a not in starts: starts.append(a)
+    return [(a, a + seconds) for a in starts]
+
+
+def _encode_sample(frames, path, s, fps, size, quality):
+    if s["dedup"]:
+        items, timed = dedup_frames(frames, fps, s["dedup_tol"]), True
+    else: items, timed = frames, False
+    if s["format"] == "WebP": write_webp(items, path, fps, size, timed=timed, **webp_options(s["webp_preset"], quality))
+    else:
+        colors = quality if quality is not None else s["gif_colors"]
+        write_gif(items, path, fps, size, dither=s["gif_dither"], max_colors=colors, stats_mode=s["gif_stats"], timed=timed)
+    return os.path.getsize(path)
+
+
+class SizeModel:
+    def __init__(self, coef, names):
+        self.coef = coef    # [定数, 各項目の係数]
+        self.names = names  # 係数に対応する項目 ("width" / "fps" / "quality")
+
+    @classmethod
+    def fit(cls, probes):
+        # probes: [(幅, fps, 品質, 1秒あたりのバイト数)]。試した中で値が変わらなかった項目は係数 0 とする
+        names = [name for i, name in enumerate(("width", "fps", "quality"))
+                 if probes[0][i] is not None and len({p[i] for p in probes}) > 1]
+        cols = {"width": 0, "fps": 1, "quality": 2}
+        X = np.array([[1.0] + [math.log(p[cols[n]]) for n in names] for p in probes])
+        y = np.array([math.log(max(p[3], 1.0)) for p in probes])
+        coef, *_ = np.linalg.lstsq(X, y, rcond=None)
+        return cls(coef, names)
+
+    def predict(self, width, fps, quality, duration):
+        values = {"width": width, "fps": fps, "quality": quality}
+        log_rate = self.coef[0] + sum(c * math.log(values[n]) for c, n in zip(self.coef[1:], self.names))
+        return math.exp(log_rate) * duration
+
+
+def sample_model(video_path, clip, s, metrics):
+    # 短い区間を試しにエンコードしてサイズのモデルを作る
+    start = s["start"]
+    end = clip.duration if s["end"] is None else s["end"]
+    w0, f0 = int(s["width"]), float(s["fps"])
+    qkey = _quality_key(s)
+    q0 = _quality_limit(s, qkey) if qkey else None
+    size0 = output_size(clip.size, w0)
+    w_lo, f_lo = max(MIN_WIDTH, w0 // 2), max(1, round(f0 / 2))
+    q_lo = None if qkey is None else (GIF_COLORS[-2] if qkey == "gif_colors" else max(WEBP_QUALITIES[-1], q0 - 30))
+    combos = [(w0, f0, q0), (w_lo, f0, q0), (w0, f_lo, q0)]
+    if qkey: combos.append((w0, f0, q_lo))
+    combos.append((w_lo, f_lo, q_lo if qkey else q0))
+    sizes, seconds = [0] * len(combos), 0.0
+    with metrics.stage("sample"), tempfile.TemporaryDirectory() as tmp:
+        # 区間ごとに上限の幅・fps で1回だけデコードし、組み合わせごとに縮小・間引きしてエンコードする (メモリは1区間分)
+        try: keyframes = keyframe_times(video_path)
+        except RuntimeError: keyframes = ()
+        for a, b in _segments(start, end, keyframes, clip.fps):
+            times = a + np.arange(0, b - a, 1.0 / f0)
+            seg = [np.array(f) for f in iter_frames_at(video_path, times, size=size0, src_fps=clip.fps, src_size=clip.size, seek=True)]
+            seconds += len(seg) / f0
+            for i, (w, f, q) in enumerate(combos):
+                size = output_size(clip.size, w)
+                frames = []
+                # 上限 fps のフレーム列から fps f の時刻に当たるものを選ぶ
+                for k in range(max(1, int(len(seg) * f / f0 + 1e-9))):
+                    frame = resize_frame(seg[int(k * f0 / f + 1e-9)], size)
+                    frames.append(apply_watermarks(frame, s["wm_configs"]) if s["wm_configs"] else frame)
+                sizes[i] += _encode_sample(frames, os.path.join(tmp, f"sample.{s['format'].lower()}"), s, f, size, q)
+    probes = [(w, f, q, n / max(seconds, 1e-3)) for (w, f, q), n in zip(combos, sizes)]
+    return SizeModel.fit(probes)
+
+
+def candidates(s):
+    # 上限以下の (幅, fps, 品質) の組み合わせ
+    w0, f0 = int(s["width"]), float(s["fps"])
+    qkey = _quality_key(s)
+    widths = sorted({max(MIN_WIDTH, int(w0 * r) // 2 * 2) for r in WIDTH_RATIOS} | {w0}, reverse=True)
+    fpss = sorted({max(min(f0, MIN_FPS), round(f0 * r)) for r in FPS_RATIOS}, reverse=True)
+    if qkey is None: qualities = [None]
+    else:
+        q0 = _quality_limit(s, qkey)
+        steps = GIF_COLORS if qkey == "gif_colors" else WEBP_QUALITIES
+        qualities = [q0] + [q for q in steps if q < q0]
+    return [(w, f, q) for w in widths for f in fpss for q in qualities]
+
+
+def _score(c, s):
+    w, f, q = c
+    score = math.log(w / s["width"]) + FPS_WEIGHT * math.log(f / s["fps"])
+    qkey = _quality_key(s)
+    if qkey: score += QUALITY_WEIGHT * math.log(q / _quality_limit(s, qkey))
+    return score
+
+
+def choose(model, s, duration, budget):
+    # 予測サイズが budget 以下で一番見た目の良い組み合わせ (なければ一番小さくなるもの) と予測サイズ
+    scored = [(c, model.predict(*c, duration)) for c in candidates(s)]
+    fitting = [(c, size) for c, size in scored if size <= budget]
+    if not fitting: return min(scored, key=lambda x: x[1])
+    return max(fitting, key=lambda x: (_score(x[0], s), x[1]))
+
+
+def apply_choice(s, choice):
+    w, f, q = choice
+    out = {**s, "width": w, "fps": f, "target_bytes": None}
+    qkey = _quality_key(s)
+    if qkey: out[qkey] = q
+    return out
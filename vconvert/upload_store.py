@@ -0,0 +1,113 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+# --- アップロード保存領域 ---
+# アップロード動画をチャンク単位でディスクへ書き出し、内容のハッシュをファイル名にする。
+# 同じ内容なら既存ファイルを再利用し、容量上限を超えたら最終利用が古いものから削除する (LRU)。
+
+CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_QUOTA = 10 * 1024 ** 3
+
+
+class UploadStore:
+    def __init__(self, root=None, quota_bytes=DEFAULT_QUOTA, chunk_size=CHUNK_SIZE):
+        self.root = root or os.path.join(tempfile.gettempdir(), "vconvert_uploads")
+        self.quota_bytes = quota_bytes
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def put(self, fileobj, suffix=".mp4"):
+        # fileobj は read(n) できるもの。書き込みながらハッシュを計算するのでメモリ使用量は1チャンク分
+        h = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    chunk = fileobj.read(self.chunk_size)
+                    if not chunk: break
+                    h.update(chunk)
+                    f.write(chunk)
+            path = os.path.join(self.root, h.hexdigest() + suffix)
+            with self._lock:
+                if os.path.exists(path): os.remove(tmp_path)
+                else: os.replace(tmp_path, path)
+                self.touch(path)
+                self._evict(keep=path)
+            return path
+        except BaseException:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            raise
+
+    def touch(self, path):
+        try: os.utime(path)
+        except OSError: pass
+
+    def usage(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.root):
+            if name.endswith(".part"): continue
+            p = os.path.join(self.root, name)
+            try: st = os.stat(p)
+            except OSError: continue
+            entries.append((p, st.st_size, st.st_mtime))
+        return entries
+
+    def _evict(self, keep=None):
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(e[1] for e in entries)
+        for p, size, _ in entries:
+            if total <= self.quota_bytes: break
+            if p == keep: continue
+            try: os.remove(p)
+            except OSError: continue
+            total -= size
+
+
+FONT_QUOTA = 256 * 1024 ** 2
+
+_store = None
+_font_store = None
+_store_lock = threading.Lock()
+
+
+def get_upload_store():
+    global _store
+    with _store_lock:
+        if _store is None: _store = UploadStore()
+        return _store
+
+
+def get_font_store():
+    # アップロードフォントも内容のハッシュ名で保存する (ユーザー間で同じパスを上書きしない)
+    global _font_store
+    with _store_lock:
+        if _font_store is None: _font_store = UploadStore(os.path.join(tempfile.gettempdir(), "vconvert_fonts"), quota_bytes=FONT_QUOTA)
+        return _font_store
+
+
+def store_font(font_file):
+    suffix = os.path.splitext(getattr(font_file, "name", ""))[1].lower() or ".ttf"
+    font_file.seek(0)
+    return get_font_store().put(font_file, suffix=suffix)
+
+
+def store_upload(uploaded_file, session_state):
+    # 再実行のたびにコピーしないよう、同じアップロードなら session_state の video_path をそのまま使う
+    store = get_upload_store()
+    upload_key = (uploaded_file.name, uploaded_file.size, getattr(uploaded_file, "file_id", None))
+    path = session_state.get("video_path")
+    if session_state.get("upload_key") == upload_key and path and os.path.exists(path):
+        store.touch(path)
+        return path
+    suffix = os.path.splitext(uploaded_file.name)[1].lower() or ".mp4"
+    uploaded_file.seek(0)
+    path = store.put(uploaded_file, suffix=suffix)
+    session_state["upload_key"] = upload_key
+    session_state["video_path"] = path
+    return path
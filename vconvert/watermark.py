@@ -0,0 +1,108 @@
+import os
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageFont, ImageDraw, ImageColor
+
+# --- 透かしエンジン ---
+# 透かしは出力サイズごとに一度だけ描画し、文字部分だけを切り出したスプライトとして保持する。
+# フレームごとの処理はスプライト範囲の NumPy アルファブレンドのみ。
+# ブレンド式は Pillow の alpha_composite (不透明な下地) と同じ整数演算なので、出力画素は従来と一致する。
+
+MARGIN = 20
+
+
+@lru_cache(maxsize=64)
+def _load_font(path, size, mtime):
+    try: return ImageFont.truetype(path, size) if path else ImageFont.load_default()
+    except Exception: return ImageFont.load_default()
+
+
+def get_font(path, size):
+    # 同じパスにアップロードフォントが上書きされることがあるので更新時刻もキーに含める
+    try: mtime = os.stat(path).st_mtime_ns if path else 0
+    except OSError: mtime = 0
+    return _load_font(path, size, mtime)
+
+
+def _wm_key(wm):
+    return (wm["text"], int(wm["pos"]), wm["color"], int(wm["size"]), int(wm["opacity"]), bool(wm["shadow"]), wm["font"])
+
+
+def _text_position(pos_idx, W, H, tw, th, m=MARGIN):
+    if pos_idx == 0: return W-tw-m, H-th-m # 右下
+    elif pos_idx == 1: return m, H-th-m # 左下
+    elif pos_idx == 2: return m, m # 左上
+    elif pos_idx == 3: return W-tw-m, m # 右上
+    else: return (W-tw)/2, (H-th)/2 # 中央
+
+
+class WatermarkSprite:
+    __slots__ = ("x0", "y0", "x1", "y1", "premul", "inv")
+
+    def __init__(self, x0, y0, x1, y1, premul, inv):
+        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+        self.premul, self.inv = premul, inv
+
+    def blend(self, frame):
+        # frame: HxWx3 uint8 (書き込み可能) をその場で更新する
+        # 一時配列はスプライト範囲の2つだけ: ((x >> 8) + x) >> 15, x = (premul + dst * inv) * 128 + 0x4000
+        region = frame[self.y0:self.y1, self.x0:self.x1]
+        tmp = np.multiply(region, self.inv, dtype=np.uint32)
+        tmp += self.premul
+        tmp *= 128
+        tmp += 0x80 << 7
+        out = tmp >> 8
+        out += tmp
+        out >>= 15
+        region[...] = out
+
+
+@lru_cache(maxsize=128)
+def _render_sprite(key, W, H, mtime):
+    text, pos_idx, color, size, opacity, shadow, font = key
+    # 従来どおりフレーム全体のレイヤーに描画してから、不透明部分だけを切り出す (1サイズにつき1回)
+    layer = Image.new("RGBA", (W, H), (255,255,255,0))
+    d = ImageDraw.Draw(layer)
+    fnt = get_font(font, size)
+    b = d.textbbox((0,0), text, font=fnt)
+    tw, th = b[2]-b[0], b[3]-b[1]
+    x, y = _text_position(pos_idx, W, H, tw, th)
+
+    rgb, fill = ImageColor.getrgb(color), (0,0,0,int(255*opacity/100))
+    if shadow:
+        for ax in range(-2,3):
+            for ay in range(-2,3): d.text((x+ax, y+ay), text, font=fnt, fill=fill)
+    d.text((x,y), text, font=fnt, fill=(rgb[0],rgb[1],rgb[2],int(255*opacity/100)))
+
+    bbox = layer.getchannel("A").getbbox()
+    if bbox is None: return None
+    x0, y0, x1, y1 = bbox
+    sprite = np.asarray(layer.crop(bbox), dtype=np.uint32)
+    alpha = sprite[..., 3:4]
+    return WatermarkSprite(x0, y0, x1, y1, sprite[..., :3] * alpha, 255 - alpha)
+
+
+def get_sprites(wm_configs, W, H):
+    sprites = []
+    for wm in wm_configs:
+        try: mtime = os.stat(wm["font"]).st_mtime_ns if wm["font"] else 0
+        except OSError: mtime = 0
+        s = _render_sprite(_wm_key(wm), W, H, mtime)
+        if s is not None: sprites.append(s)
+    return sprites
+
+
+def apply_watermarks(frame, wm_configs, inplace=False):
+    # frame: HxWx3 uint8 の ndarray。inplace=False なら入力は変更しない
+    if not wm_configs: return frame
+    H, W = frame.shape[:2]
+    out = frame if inplace and frame.flags.writeable else np.array(frame, dtype=np.uint8)
+    for s in get_sprites(wm_configs, W, H): s.blend(out)
+    return out
+
+
+def draw_watermarks(pil_img, wm_configs):
+    # 互換用: PIL 画像を受け取り RGB の PIL 画像を返す
+    frame = np.array(pil_img.convert("RGB"))
+    return Image.fromarray(apply_watermarks(frame, wm_configs, inplace=True))
@@ -0,0 +1,149 @@
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, features
+
+from .ffmpeg import encode_frames
+
+# --- アニメーション WebP エンコーダ ---
+# フレームを Pillow 同梱の libwebp (WebPAnimEncoder) に1枚ずつ直接渡す。moviepy のクリップや ffmpeg のパイプを通さない。
+# libwebp のエンコードは GIL を解放するので専用スレッドで行い、呼び出し側のデコード・リサイズ・透かしと並行に進める。
+# timed=True なら各フレームの表示時間をそのまま使う (重複除去後のフレームやサムネイルの1フレーム)。
+# Pillow の公開 API (save_all) は全フレームをメモリに持つ必要があるので、非公開の _webp.WebPAnimEncoder を直接使う。
+# 引数の形は Pillow 11 以降のもの。使えない・形が合わない場合 (Pillow が古い、将来変わった) は ffmpeg (libwebp_anim) で書き出す。
+
+# 速度と画質のプリセット。quality は非可逆なら画質、可逆ならエンコードの手間 (0-100)
+# near_lossless は 100 で無効、小さいほど可逆圧縮の前に色を丸める (libwebp の near_lossless と同じ向き)
+# balanced はこれまでの書き出し (ffmpeg の libwebp 既定の method 4、品質 80) と同じ設定
+WEBP_PRESETS = {
+    "balanced": {"method": 4, "quality": 80, "lossless": False},
+    "fast": {"method": 0, "quality": 80, "lossless": False},
+    "small": {"method": 5, "quality": 70, "lossless": False},  # method 6 は何十倍も遅い割に小さくならない
+    "near_lossless": {"method": 4, "quality": 75, "lossless": True, "near_lossless": 60},
+    "lossless": {"method": 4, "quality": 75, "lossless": True},
+}
+MAX_PENDING = 4  # エンコード待ちのフレーム数の上限 (メモリを一定に保つ)
+
+
+def webp_options(preset="balanced", quality=None):
+    # プリセットの設定。quality を指定すると画質 (可逆なら手間) だけ上書きする
+    opts = {"method": 4, "quality": 80, "lossless": False, "near_lossless": 100, "minimize_size": False, **WEBP_PRESETS[preset]}
+    if quality is not None: opts["quality"] = int(quality)
+    return opts
+
+
+def _new_encoder(size, loop, minimize_size, lossless):
+    from PIL import _webp
+    # キーフレーム間隔は gif2webp と同じ既定値
+    kmin, kmax = (9, 17) if lossless else (3, 5)
+    return _webp.WebPAnimEncoder((int(size[0]), int(size[1])), 0, int(loop), bool(minimize_size), kmin, kmax, False, False)
+
+
+def _add(enc, img, timestamp, lossless, quality, method):
+    # img=None で終了時刻を渡す
+    enc.add(None if img is None else img.getim(), int(timestamp), bool(lossless), float(quality), 100.0, int(method))
+
+
+@lru_cache(maxsize=1)
+def native_available():
+    # 非公開 API なので、属性があるかだけでなく小さな画像で実際に一度エンコードして引数の形を確かめる
+    try:
+        if not features.check("webp"): return False
+        enc = _new_encoder((2, 2), 0, False, False)
+        _add(enc, Image.new("RGBA", (2, 2)), 0, False, 80, 0)
+        _add(enc, None, 100, False, 80, 0)
+        return enc.assemble("", b"", "") is not None
+    except Exception: return False
+
+
+def near_lossless_frame(frame, level):
+    # 各色を 2^bits 単位に丸めて可逆圧縮しやすくする (level 100 で無変換、20 下げるごとに1ビット)
+    bits = max(0, min(5, (100 - int(level)) // 20))
+    if bits == 0: return frame
+    half = 1 << (bits - 1)
+    return np.minimum((frame.astype(np.uint16) + half) >> bits << bits, 255).astype(np.uint8)
+
+
+def _fix_last_duration(path, total_ms):
+    # libwebp_anim は最後のフレームの表示時間を平均値で書くので、全体の長さに合うよう ANMF チャンクを書き換える
+    with open(path, "r+b") as f:
+        data = bytearray(f.read())
+        pos, frames = 12, []
+        while pos + 8 <= len(data):
+            tag, size = data[pos:pos + 4], struct.unpack("<I", data[pos + 4:pos + 8])[0]
+            if tag == b"ANMF": frames.append(pos + 8 + 12)
+            pos += 8 + size + (size & 1)
+        if not frames: return
+        durations = [int.from_bytes(data[p:p + 3], "little") for p in frames]
+        last = max(1, min(0xFFFFFF, int(round(total_ms)) - sum(durations[:-1])))
+        data[frames[-1]:frames[-1] + 3] = last.to_bytes(3, "little")
+        f.seek(0)
+        f.write(data)
+
+
+def _write_webp_ffmpeg(frames, out_path, fps, size, quality, method, lossless, loop, timed):
+    total = {"ms": 0.0}
+    if timed:
+        def count(items):
+            for frame, duration in items:
+                total["ms"] += duration * 1000.0
+                yield frame, duration
+        frames = count(frames)
+    # 時間単位を 1 ms に固定する (gif.write_gif と同じ理由)
+    output_args = ["-c:v", "libwebp_anim", "-preset", "default", "-lossless", str(int(lossless)),
+                   "-quality", str(quality), "-compression_level", str(method),
+                   "-fps_mode", "vfr" if timed else "cfr", "-enc_time_base", "1/1000", "-loop", str(loop), "-f", "webp", "-y", out_path]
+    encode_frames(frames, size, output_args, fps=fps, timed=timed, what="WebP encoding")
+    if timed: _fix_last_duration(out_path, total["ms"])
+    return out_path
+
+
+def write_webp(frames, out_path, fps, size, quality=80, method=4, lossless=False, near_lossless=100, minimize_size=False,
+               loop=0, timed=False, threaded=True):
+    # frames: HxWx3 uint8 の ndarray のイテラブル (timed=True なら (フレーム, 表示時間[秒]))
+    if not native_available():
+        if lossless and near_lossless < 100: frames = _map_frames(frames, timed, lambda f: near_lossless_frame(f, near_lossless))
+        return _write_webp_ffmpeg(frames, out_path, fps, size, quality, method, lossless, loop, timed)
+    w, h = int(size[0]), int(size[1])
+    enc = _new_encoder((w, h), loop, minimize_size, lossless)
+
+    def add(img, timestamp):
+        _add(enc, img, timestamp, lossless, quality, method)
+
+    pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vconvert-webp") if threaded else None
+    pending = deque()
+    try:
+        t_ms, n = 0.0, 0
+        for item in frames:
+            frame, duration = item if timed else (item, 1.0 / fps)
+            frame = np.ascontiguousarray(frame, dtype=np.uint8)
+            if frame.shape != (h, w, 3): raise ValueError(f"frame size {frame.shape[1]}x{frame.shape[0]} != {w}x{h}")
+            if lossless and near_lossless < 100: frame = near_lossless_frame(frame, near_lossless)
+            # RGBA への変換でコピーされるので、呼び出し側がバッファを使い回しても影響しない
+            img = Image.fromarray(frame, "RGB").convert("RGBA")
+            if pool is None: add(img, round(t_ms))
+            else:
+                pending.append(pool.submit(add, img, round(t_ms)))
+                while len(pending) > MAX_PENDING: pending.popleft().result()
+            t_ms += duration * 1000.0
+            n += 1
+        while pending: pending.popleft().result()
+        if n == 0: raise RuntimeError("WebP encoding failed: no frames")
+        # 最後のフレームの表示時間は終了時刻で決まる
+        _add(enc, None, round(t_ms), lossless, quality, 0)
+        data = enc.assemble("", b"", "")
+    finally:
+        for fut in pending: fut.cancel()
+        if pool is not None: pool.shutdown(wait=True)
+    if data is None: raise RuntimeError("WebP encoding failed")
+    with open(out_path, "wb") as f: f.write(data)
+    return out_path
+
+
+def _map_frames(frames, timed, func):
+    for item in frames:
+        if timed: yield func(item[0]), item[1]
+        else: yield func(item)
@@ -0,0 +1,78 @@
+import io
+import os
+import tempfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# --- ZIP 書き出し (静止画抽出) ---
+# 画像のエンコードをスレッドプールで並列に行い、結果を順番どおりジョブ専用の ZIP へ直接書き込む。
+# 中間ファイルは作らない。path を渡すとそのファイルへ、省略時はメモリ上限を超えるとディスクへ退避する
+# SpooledTemporaryFile に作る。
+
+DEFAULT_SPOOL_MEMORY = 64 * 1024 ** 2
+
+
+def encode_image(frame, fmt="JPEG", quality=85):
+    # frame: HxWx3 uint8 の ndarray (または PIL 画像)
+    img = frame if isinstance(frame, Image.Image) else Image.fromarray(frame)
+    buf = io.BytesIO()
+    if fmt == "JPEG": img.convert("RGB").save(buf, format="JPEG", quality=quality)
+    else: img.save(buf, format=fmt)
+    return buf.getvalue()
+
+
+class ZipImageWriter:
+    def __init__(self, fmt="JPEG", quality=85, workers=None, max_pending=None, spool_max_memory=DEFAULT_SPOOL_MEMORY, path=None):
+        self.fmt = fmt
+        self.quality = quality
+        self.ext = "jpg" if fmt == "JPEG" else fmt.lower()
+        workers = workers or min(8, os.cpu_count() or 1)
+        self.max_pending = max_pending or workers * 2
+        self.path = path
+        if path: self.spool = open(path, "w+b")
+        else: self.spool = tempfile.SpooledTemporaryFile(max_size=spool_max_memory, suffix=".zip")
+        # JPEG/PNG はこれ以上圧縮できないので無圧縮で格納する
+        self.zip = zipfile.ZipFile(self.spool, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vconvert-zip")
+        self._pending = deque()
+        self.count = 0
+
+    def add(self, frame, name=None):
+        # 未書き込みの画像が max_pending を超えたら古いものから書き込む (メモリを一定に保つ)
+        name = name or f"image_{len(self._pending) + self.count + 1:03d}.{self.ext}"
+        self._pending.append((name, self._pool.submit(encode_image, frame, self.fmt, self.quality)))
+        while len(self._pending) >= self.max_pending: self._write_one()
+        return name
+
+    def _write_one(self):
+        name, fut = self._pending.popleft()
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        self.zip.writestr(info, fut.result())
+        self.count += 1
+
+    def finish(self):
+        # すべて書き込んで ZIP を閉じ、先頭に巻き戻したファイルオブジェクトを返す
+        while self._pending: self._write_one()
+        self.zip.close()
+        self._pool.shutdown(wait=True)
+        self.spool.seek(0)
+        return self.spool
+
+    def close(self):
+        for _, fut in self._pending: fut.cancel()
+        self._pending.clear()
+        self._pool.shutdown(wait=False)
+        try: self.zip.close()
+        except Exception: pass
+        self.spool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()